@@ -6,95 +6,254 @@ from utils.constants import *
 from utils.space import *
 import math
 import argparse
-import importlib.util
-import os
 from utils.misc import calc_move_with_gain
+from utils.trace import TraceRecorder
+from utils.latency import FrameStats
+from utils.wire import PROTOCOL_BINARY, decode_running, encode_reply
+from utils.session import SessionPool
+from utils.rooms import load_room
+from utils.profiling import PROFILE_DIR, profile_path, format_stages
 
 import time
+import itertools
+import signal
+from collections import deque
 
-meter_per_px = 5/200
+meter_per_px = METER_PER_PX
 
-def import_function_from_file(file_name, function_name):
-    if not os.path.exists(file_name):
-        return None
-
-    spec = importlib.util.spec_from_file_location("temp_module", file_name)
-    if spec is None:
-        return None
+file_s = ""
+is_universal = False
+record_dir = None
+stats_file = None
+verbose = True
+allow_binary = True
+# FrameStats of every open connection, for {"type": "stats", "scope": "all"}
+live_stats = {}
+connection_ids = itertools.count(1)
+# built in main: the controller is compiled and warmed up once, before the server accepts connections
+session_pool = None
+# running frames buffered per session before the websocket stops being read
+queue_size = 8
+# "fifo" answers every frame in order; "latest" skips running frames a newer one is waiting behind
+schedule = "fifo"
+# answer frames that already waited longer than the frame budget with the previous gains
+degrade = False
+# running frames of every session captured with cProfile after its start message (0: none), and where
+profile_frames = 0
+profile_dir = PROFILE_DIR
 
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+async def read_frames(websocket, queue, closed):
+    # Move received frames into the session queue. When the queue is full this waits,
+    # the websocket stops being read and the client is slowed down (backpressure).
+    # The end of the connection sets closed, plus a None in the queue when there is room;
+    # waiting for room here could block forever once the session stopped reading.
+    try:
+        async for data in websocket:
+            await queue.put((data, time.perf_counter()))
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        closed.set()
+        try:
+            queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
 
-    if function_name in dir(module):
-        function = getattr(module, function_name)
-        return function
-    else:
+def parse_frame(item):
+    # (message, binary, seconds spent parsing, time received), None at the end of the connection
+    if item is None:
         return None
+    data, t_received = item
+    t_parse = time.perf_counter()
+    # binary frames are running messages of a session that negotiated the binary protocol
+    binary = isinstance(data, bytes)
+    message = decode_running(data) if binary else json.loads(data)
+    return message, binary, time.perf_counter() - t_parse, t_received
 
-file_s = ""
-is_universal = False
-
+async def next_frame(queue, pending, closed):
+    if pending:
+        return pending.popleft()
+    if closed.is_set() and queue.empty():
+        return None
+    return parse_frame(await queue.get())
 
+def coalesce_running(frame, queue, pending):
+    """
+    Take the running frames already waiting behind the running frame `frame`. Return the frames to answer,
+    oldest first (every need_reset frame, so no reset is lost, then the newest frame), and the number of
+    frames dropped. The first waiting message of another type, and everything after it, stays in pending.
+    """
+    run = [frame]
+    while True:
+        if pending:
+            waiting = pending.popleft()
+        else:
+            try:
+                waiting = parse_frame(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        if waiting is None or waiting[0]["type"] != "running":
+            pending.appendleft(waiting)
+            break
+        run.append(waiting)
+    keep = [f for f in run[:-1] if f[0]["need_reset"]] + [run[-1]]
+    return keep, len(run) - len(keep)
 
 async def user_loop(websocket, path):
     all_time = 0
-    calc_time = 0
-    nn=0
     r_time = time.time()
-    calc_gain = None
-    update_user = None
-    update_reset = None
-    if is_universal:
-        update_user = import_function_from_file(file_s, "update_user")
-        update_reset = import_function_from_file(file_s, "update_reset")
-    else:
-        calc_gain = import_function_from_file(file_s, "calc_gain")
-        update_reset = import_function_from_file(file_s, "update_reset")
-    
-    while True:
-        data = await websocket.recv()
-        data = json.loads(data)
-        print(data)
-        if data["type"] == "start":
-            physical_space = Space(data["physical"]["border"], data["physical"]["obstacle_list"], meter_per_px)
-            message = json.dumps({"type": "start"})
-            await websocket.send(message)
-        elif data["type"] == "running":
-            user = UserInfo(data["physical"]["user_x"], data["physical"]["user_y"], data["physical"]["user_direction"], data["user_v"], data["user_w"], meter_per_px)
-            delta_t = data["delta_t"]
-            need_reset = data["need_reset"]
-            if need_reset:
-                user = update_reset(user, physical_space, delta_t)
-                message = json.dumps({"type": "running", "user_x": user.x / meter_per_px, "user_y": user.y / meter_per_px, "user_direction": user.angle, "reset": True})
-            else:
-                has_reset=False
-                if is_universal:
-                    user, has_reset = update_user(user, physical_space, delta_t)
-                    message = json.dumps({"type": "running", "user_x": user.x / meter_per_px, "user_y": user.y / meter_per_px, "user_direction": user.angle, "reset": has_reset})
+    connection_id = next(connection_ids)
+    stats = FrameStats()
+    live_stats[connection_id] = stats
+    clock = time.perf_counter
+    # controller calls go through the session pool, off the event loop unless it is inline
+    session = await session_pool.open(connection_id)
+    recorder = None
+    queue = asyncio.Queue(maxsize=queue_size)
+    closed = asyncio.Event()
+    reader = asyncio.ensure_future(read_frames(websocket, queue, closed))
+    # frames taken from the queue but not handled yet
+    pending = deque()
+    # last gain reply, reused by degraded frames
+    last_gains = None
+
+    try:
+        while True:
+            frame = await next_frame(queue, pending, closed)
+            if frame is None:
+                break
+            if schedule == "latest" and frame[0]["type"] == "running":
+                keep, dropped = coalesce_running(frame, queue, pending)
+                if dropped:
+                    stats.drop(dropped)
+                pending.extendleft(reversed(keep[1:]))
+                frame = keep[0]
+            data, binary, t_parse, t_received = frame
+            t_queue = clock() - t_received - t_parse
+            if verbose:
+                print(data)
+            if data["type"] == "start":
+                await session_pool.call(session, "start", data["physical"])
+                if record_dir is not None:
+                    if recorder is not None:
+                        recorder.close()
+                    recorder = TraceRecorder.for_session(record_dir, data["physical"], meter_per_px=meter_per_px, universal=is_universal, controller=file_s)
+                if profile_frames > 0:
+                    await session_pool.call(session, "profile", profile_frames, profile_path(profile_dir, f"session{connection_id}"))
+                r_time = time.time()
+                last_gains = None
+                stats = FrameStats()
+                live_stats[connection_id] = stats
+                reply = {"type": "start"}
+                if allow_binary and data.get("protocol") == PROTOCOL_BINARY:
+                    reply["protocol"] = PROTOCOL_BINARY
+                message = json.dumps(reply)
+                await websocket.send(message)
+            elif data["type"] == "running":
+                if degrade and last_gains is not None and not data["need_reset"] and t_queue > stats.budget:
+                    # already late: answer at once with the previous gains instead of computing new ones
+                    reply, t_compute = last_gains, 0.0
+                    stats.degraded += 1
                 else:
-                    trans_gain, rot_gain, cur_gain_r, cur_direction = calc_gain(user, physical_space, delta_t)
-                    message = json.dumps({"type": "running-gain", "trans_gain": trans_gain, "rot_gain": rot_gain, "cur_gain": cur_gain_r*(cur_direction)/abs(cur_direction), "reset": has_reset})
+                    reply, t_compute = await session_pool.call(session, "running", data)
+                    if reply["type"] == "running-gain":
+                        last_gains = reply
+                if recorder is not None:
+                    recorder.frame(data, reply)
+                t_serialize = clock()
+                message = encode_reply(reply) if binary else json.dumps(reply)
+                t_serialize = clock() - t_serialize
+
+                t_send = clock()
+                await websocket.send(message)
+                t_send = clock() - t_send
+                # the total also covers the hand-over to and from the session pool
+                stats.record(t_parse, t_compute, t_serialize, t_send, t_queue, clock() - t_received)
+
+            elif data["type"] == "stats":
+                # live statistics of this session, or of every open connection with "scope": "all"
+                if data.get("scope") == "all":
+                    payload = {str(k): v.as_dict() for k, v in live_stats.items()}
+                else:
+                    payload = stats.as_dict()
+                await websocket.send(json.dumps({"type": "stats", "stats": payload}))
+
+            elif data["type"] == "profile":
+                # {"type": "profile", "frames": N} captures the next N running frames with cProfile, "frames": 0 stops
+                # a capture early; the reply holds the stage timers of the session and the dump file
+                reply = {"type": "profile"}
+                if "frames" in data:
+                    path = profile_path(profile_dir, f"session{connection_id}")
+                    written = await session_pool.call(session, "profile", int(data["frames"]), path)
+                    if data["frames"] > 0:
+                        reply["file"] = path
+                    if written is not None:
+                        reply["written"] = written
+                reply["stages"] = await session_pool.call(session, "stage_stats")
+                await websocket.send(json.dumps(reply))
 
-            n_time = time.time()
-            await websocket.send(message)
-            calc_time += time.time() - n_time
-            nn+=1
-            
-        elif data["type"] == "end":
-            message = json.dumps({"type": "end"})
-            await websocket.send(message)
-            all_time = time.time() - r_time
-            print("All time: ", all_time, "Calc time: ", calc_time, "Calc time per frame: ", calc_time/nn)
+            elif data["type"] == "end":
+                if recorder is not None:
+                    recorder.close()
+                    recorder = None
+                message = json.dumps({"type": "end"})
+                await websocket.send(message)
+                all_time = time.time() - r_time
+                print("All time: ", all_time, stats.summary())
+                print("Stages: ", format_stages(await session_pool.call(session, "stage_stats")))
+                if stats_file is not None:
+                    stats.export(stats_file, controller=file_s, universal=is_universal, all_time=all_time)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        reader.cancel()
+        live_stats.pop(connection_id, None)
+        await session_pool.close(session)
+        # keep what was recorded when the connection drops before end
+        if recorder is not None:
+            recorder.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-u','--universal',help='Enable universal interface',default=False,action='store_true')
     parser.add_argument('-f','--file',default='controller/client_logic.py')
+    parser.add_argument('--record',default=None,help='record every session as a binary trace under this directory')
+    parser.add_argument('--stats-file',default=None,help='append the latency statistics of every session to this JSON lines file')
+    parser.add_argument('-q','--quiet',help='Do not print every received message',default=False,action='store_true')
+    parser.add_argument('--json-only',help='Refuse the binary protocol in the start handshake',default=False,action='store_true')
+    parser.add_argument('--executor',choices=SessionPool.MODES,default='thread',help='where controller calls run: on the event loop, in a thread pool or in worker processes')
+    parser.add_argument('--workers',type=int,default=None,help='threads or processes of the executor (default: number of CPU cores)')
+    parser.add_argument('--queue-size',type=int,default=queue_size,help='frames buffered per session before backpressure applies')
+    parser.add_argument('--room',default=None,help='warm the controller up on this room (JSON start message or its physical part) instead of an empty room')
+    parser.add_argument('--schedule',choices=('fifo','latest'),default=schedule,help='fifo: answer every running frame in order; latest: skip stale running frames and answer the newest one (need_reset frames are always answered)')
+    parser.add_argument('--degrade',default=False,action='store_true',help='answer running frames that waited longer than the frame budget with the previous gains')
+    parser.add_argument('--profile',type=int,default=0,metavar='N',help='capture the first N running frames of every session with cProfile')
+    parser.add_argument('--profile-dir',default=PROFILE_DIR,help='where cProfile dumps are written')
+    parser.add_argument('--reload-interval',type=float,default=1.0,help='seconds between checks of the controller file for hot reload, 0 to disable')
     args = parser.parse_args()
 
     file_s=args.file
     is_universal=args.universal
+    record_dir=args.record
+    stats_file=args.stats_file
+    verbose=not args.quiet
+    allow_binary=not args.json_only
+    queue_size=args.queue_size
+    schedule=args.schedule
+    degrade=args.degrade
+    profile_frames=args.profile
+    profile_dir=args.profile_dir
+    t_load = time.perf_counter()
+    session_pool=SessionPool(file_s, is_universal, meter_per_px, args.executor, args.workers, load_room(args.room) if args.room else None)
+    print(f"controller {file_s} loaded and warmed up in {time.perf_counter() - t_load:.3f} s")
     start_server = websockets.serve(user_loop, "localhost", 8765)
     
     asyncio.get_event_loop().run_until_complete(start_server)
-    asyncio.get_event_loop().run_forever()
+    # stop cleanly on kill as well, so worker processes are shut down with the server
+    asyncio.get_event_loop().add_signal_handler(signal.SIGTERM, asyncio.get_event_loop().stop)
+    if args.reload_interval > 0:
+        asyncio.get_event_loop().create_task(session_pool.watch(args.reload_interval))
+    try:
+        asyncio.get_event_loop().run_forever()
+    finally:
+        session_pool.shutdown()
@@ -4,7 +4,28 @@ import math
 
 # use the translated visibility-polygon RDW implementation
 from vis_poly_rdw.vec2 import Vec2
-from vis_poly_rdw.vis_poly_rdw import VisPolyRdw
+from vis_poly_rdw.vis_poly_rdw import VisPolyRdw, CompiledSpace
+from vis_poly_rdw.vis_field import VisField
+
+_compiled = None
+
+def prepare_space(physical_space : Space):
+    """
+    Optional hook, called once per start message. The returned object is passed to
+    calc_gain / update_reset instead of the raw Space for the rest of the session.
+    """
+    global _compiled
+    # the NumPy backend computes the physical and virtual polygons in one fused pass
+    _compiled = CompiledSpace(physical_space, algorithm='numpy')
+    # slices precomputed offline for this room (tools/build_vis_field.py), if any
+    _compiled.field = VisField.find(physical_space.border, physical_space.obstacle_list)
+    return _compiled
+
+def _compiled_for(physical_space : Space):
+    # callers that pass a plain Space still get the environment compiled only once
+    if _compiled is None or _compiled.space is not physical_space:
+        prepare_space(physical_space)
+    return _compiled
 
 # TODO: Implement your own logic in the following functions.
 def calc_gain(user : UserInfo, physical_space : Space, delta : float):
@@ -45,48 +66,41 @@ def calc_gain(user : UserInfo, physical_space : Space, delta : float):
     # if dist < 125:
     #     curvature_gain_radius = MIN_CUR_GAIN_R * (2.5/(dist+1.25))
     # return MAX_TRANS_GAIN, rotation_gain, curvature_gain_radius, direction
-    # Build environment dicts expected by VisPolyRdw
-    phys_vertices = [ (t[0], t[1]) for t in physical_space.border ]
-    phys_obs = [ [(p[0], p[1]) for p in obs] for obs in physical_space.obstacle_list ]
-
-    # convert to Vec2 objects for pasumi_py
-    env_phys = {
-        'vertices': [Vec2(x,y) for (x,y) in phys_vertices],
-        'obstacles': [[Vec2(x,y) for (x,y) in obs] for obs in phys_obs]
-    }
-    # virtual environment: same boundary but no obstacles (simple assumption)
-    env_virt = {
-        'vertices': [Vec2(x,y) for (x,y) in phys_vertices],
-        'obstacles': []
-    }
-
-    vis = VisPolyRdw()
+    # the visibility environments are compiled once per session (see prepare_space)
+    compiled = physical_space if isinstance(physical_space, CompiledSpace) else _compiled_for(physical_space)
+
+    vis = compiled.vis
     pos = Vec2(user.x, user.y)
     heading = user.angle
 
-    phys_poly = vis.get_vis_poly(pos, env_phys, heading)
-    virt_poly = vis.get_vis_poly(pos, env_virt, heading)
-
-    # choose slice matching logic (closest area)
-    if not phys_poly.slices or not virt_poly.slices:
-        # fallback conservative gains
-        return MAX_TRANS_GAIN, MAX_ROT_GAIN, MIN_CUR_GAIN_R, 1
-
-    virt_slice = virt_poly.slices[0]
-    best_slice = None
-    best_diff = float('inf')
-    for s in phys_poly.slices:
-        if abs(s.theta_offset) > math.pi * 0.5:
-            continue
-        diff = abs(virt_slice.area - s.area)
-        if diff < best_diff:
-            best_diff = diff
-            best_slice = s
-    if best_slice is None:
-        best_slice = phys_poly.slices[0]
+    looked_up = compiled.field.lookup(user.x, user.y, heading) if compiled.field is not None else None
+    if looked_up is not None:
+        # precomputed slices of the cell (see vis_poly_rdw/vis_field.py)
+        phys, virt = looked_up
+    else:
+        # virtual environment: same boundary but no obstacles (simple assumption), so both
+        # polygons share their rays and border intersections (fused with the NumPy backend)
+        if vis.timers is None:
+            phys, virt = vis.get_vis_polys(pos, compiled.physical, compiled.virtual, heading)
+        else:
+            # the session profiles this call as a stage of its own
+            phys, virt = vis.timers.call("get_vis_polys", vis.get_vis_polys, pos, compiled.physical, compiled.virtual, heading)
+        phys = phys.slice_array
+        virt = virt.slice_array
+
+        if len(phys) == 0 or len(virt) == 0:
+            # fallback conservative gains
+            return MAX_TRANS_GAIN, MAX_ROT_GAIN, MIN_CUR_GAIN_R, 1
+
+    # choose slice matching logic (closest area among the frontal slices)
+    v = virt.front()
+    b = phys.best_match(virt.area[v])
+    virt_avg_height = float(virt.avg_height[v])
+    best_bisector = Vec2(phys.bisector_x[b], phys.bisector_y[b])
+    best_avg_height = float(phys.avg_height[b])
 
     # steer target (direction vector)
-    steer_target = Vec2(user.x, user.y) + best_slice.bisector
+    steer_target = Vec2(user.x, user.y) + best_bisector
 
     # direction to steer: sign of angle from user heading to steer target
     user_dir = Vec2(math.cos(user.angle), math.sin(user.angle))
@@ -101,8 +115,8 @@ def calc_gain(user : UserInfo, physical_space : Space, delta : float):
         direction = 1 if angle_to_gradient > 0 else -1
 
     # translation gain: ratio of available space in phys/virt (avg height)
-    virt_h = virt_slice.avg_height if virt_slice.avg_height > 0 else 1.0
-    phys_h = best_slice.avg_height if best_slice.avg_height > 0 else virt_h
+    virt_h = virt_avg_height if virt_avg_height > 0 else 1.0
+    phys_h = best_avg_height if best_avg_height > 0 else virt_h
     trans_gain = phys_h / virt_h
     trans_gain = max(MIN_TRANS_GAIN, min(MAX_TRANS_GAIN, trans_gain))
 
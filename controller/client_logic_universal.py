@@ -4,6 +4,11 @@ import math
 from utils.misc import calc_move_with_gain
 
 
+def prepare_space(physical_space : Space):
+    # update_user checks every new position; the signed distance field answers most checks without polygon tests
+    physical_space.build_sdf()
+    return physical_space
+
 def calc_gain(user, physical_space, delta):
     return 1, 1, MIN_CUR_GAIN_R, 1
 
@@ -0,0 +1,56 @@
+"""
+Compare controllers over many rooms and seeds, using all CPU cores.
+
+    python -m tools.batch_run --gain controller/client_logic.py \
+        --universal controller/client_logic_universal.py \
+        --rooms rooms/*.json --seeds 100 --frames 20000 --checkpoint runs.jsonl --out table.csv
+
+Rerunning the same command with the same --checkpoint skips the runs already finished.
+"""
+import argparse
+from utils.constants import *
+from utils.batch import make_grid, run_batch, aggregate, write_csv
+
+def parse_seeds(text):
+    # "10" -> 0..9, "5-9" -> 5..9, "1,4,7" -> those seeds
+    if "," in text:
+        return [int(s) for s in text.split(",")]
+    if "-" in text:
+        lo, hi = text.split("-")
+        return list(range(int(lo), int(hi) + 1))
+    return list(range(int(text)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gain',nargs='*',default=[],help='controller files run in gain mode')
+    parser.add_argument('--universal',nargs='*',default=[],help='controller files run in universal mode (-u)')
+    parser.add_argument('--rooms',nargs='+',required=True,help='room JSON files')
+    parser.add_argument('--seeds',default='10')
+    parser.add_argument('--frames',type=int,default=10000)
+    parser.add_argument('--dt',type=float,default=DELTA_T)
+    parser.add_argument('--meter-per-px',type=float,default=METER_PER_PX)
+    parser.add_argument('--workers',type=int,default=None,help='default: number of CPU cores')
+    parser.add_argument('--checkpoint',default='batch_runs.jsonl',help='per-run results, used to resume')
+    parser.add_argument('--retry-errors',default=False,action='store_true')
+    parser.add_argument('--out',help='write the per-run table to this CSV file')
+    parser.add_argument('--summary',help='write the aggregated table to this CSV file')
+    args = parser.parse_args()
+
+    controllers = [(f, False) for f in args.gain] + [(f, True) for f in args.universal]
+    if not controllers:
+        parser.error("give at least one controller with --gain or --universal")
+    configs = make_grid(controllers, args.rooms, parse_seeds(args.seeds), args.frames, args.dt, args.meter_per_px)
+    rows = run_batch(configs, args.checkpoint, args.workers, args.retry_errors)
+
+    errors = [r for r in rows if r.get("error")]
+    for row in errors:
+        print(f"FAILED {row['key']}\n{row['error']}")
+    table = aggregate(rows)
+    print(f"{'controller':<40} {'mode':<10} {'room':<30} {'runs':>5} {'resets/m':>9} {'mean ms':>8} {'p99 ms':>8} {'fps':>9}")
+    for t in table:
+        print(f"{t['controller']:<40} {t['mode']:<10} {t['room']:<30} {t['runs']:>5} {t['resets_per_meter']:>9.4f} "
+              f"{t['compute_mean_ms']:>8.3f} {t['compute_p99_ms']:>8.3f} {t['fps']:>9.0f}")
+    if args.out:
+        write_csv(rows, args.out)
+    if args.summary:
+        write_csv(table, args.summary)
@@ -0,0 +1,327 @@
+"""
+Scaling benchmarks for the geometry and controller hot paths.
+
+Every benchmark runs on synthetic rooms (utils.rooms.synthetic_room) of growing
+segment count and reports p50 / p99 latency per size, plus the exponent k of a
+least-squares fit p50 ~ n^k, which exposes O(V^2) behaviour. Results are saved
+as JSON and can be compared against a baseline run:
+
+    python -m tools.benchmark --out bench.json
+    python -m tools.benchmark --baseline bench.json --threshold 1.25
+
+--check instead compares the visibility backends with the ray caster on the same rooms and
+on a room whose obstacles overlap each other and the border, checks that simplify keeps
+every vertex of convex polygons and drops none further than its tolerance from the edge
+replacing it, and exits with status 1 when a check fails.
+"""
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import numpy as np
+from utils.constants import *
+from utils.controller import load_controller
+from utils.rooms import synthetic_room, room_space
+from utils.space import UserInfo
+from utils.misc import calc_move_with_gain
+from vis_poly_rdw.vec2 import Vec2
+from vis_poly_rdw.vis_poly_rdw import VisPolyRdw
+from vis_poly_rdw.environment import CompiledEnv
+from vis_poly_rdw.visibility_polygon import SIMPLIFY_TOLERANCE, VisibilityPolygon, simplify_ring
+
+SIZES = (10, 30, 100, 300, 1000)
+
+def free_poses(space, n, rng):
+    # random user poses in free space, in the inner part of the room
+    c_x, c_y = space.get_center()
+    r = min(max(p[0] for p in space.border) - c_x, max(p[1] for p in space.border) - c_y) * 0.7
+    xs = rng.uniform(c_x - r, c_x + r, n * 4)
+    ys = rng.uniform(c_y - r, c_y + r, n * 4)
+    free = ~space.in_obstacle_many(xs, ys)
+    xs = xs[free][:n]
+    ys = ys[free][:n]
+    return [(x, y, a) for x, y, a in zip(xs.tolist(), ys.tolist(), rng.uniform(-math.pi, math.pi, len(xs)).tolist())]
+
+def measure(fn, args_list, budget, min_calls = 5):
+    """
+    Call fn(*args) cycling through args_list until budget seconds are spent (at least min_calls).
+    Return the per-call times in seconds.
+    """
+    times = []
+    spent = 0.0
+    i = 0
+    while spent < budget or len(times) < min_calls:
+        args = args_list[i % len(args_list)]
+        t = time.perf_counter()
+        fn(*args)
+        dt = time.perf_counter() - t
+        times.append(dt)
+        spent += dt
+        i += 1
+    return np.asarray(times)
+
+class Case:
+    """
+    A benchmark: setup(space, poses, controller_file) returns (fn, args_list) for one room size.
+    max_size skips sizes that are too slow for the case.
+    """
+    def __init__(self, name, setup, max_size = None):
+        self.name = name
+        self.setup = setup
+        self.max_size = max_size
+
+def vis_poly_case(algorithm):
+    def setup(space, poses, controller_file):
+        vis = VisPolyRdw(algorithm=algorithm)
+        env = CompiledEnv(space.border, space.obstacle_list)
+        return vis.get_vis_poly, [(Vec2(x, y), env, a) for x, y, a in poses]
+    return setup
+
+def simplified_setup(space, poses, controller_file):
+    vis = VisPolyRdw(algorithm='numpy', simplify_tolerance=SIMPLIFY_TOLERANCE)
+    env = CompiledEnv(space.border, space.obstacle_list)
+    return vis.get_vis_poly, [(Vec2(x, y), env, a) for x, y, a in poses]
+
+def incremental_setup(space, poses, controller_file):
+    # a walk at 1.4 m/s and 50 fps from every pose, alternating 10 walking frames and
+    # 10 frames of turning on the spot, so consecutive calls see nearby poses
+    vis = VisPolyRdw(algorithm='numpy', incremental=True)
+    env = CompiledEnv(space.border, space.obstacle_list)
+    frames = []
+    for x, y, a in poses:
+        for k in range(20):
+            if k < 10:
+                x += 0.028 * math.cos(a)
+                y += 0.028 * math.sin(a)
+            else:
+                a += 0.02
+            frames.append((Vec2(x, y), env, a))
+    return vis.get_vis_poly, frames
+
+def fused_setup(space, poses, controller_file):
+    # physical and virtual polygons of the same pose, as calc_gain needs them
+    vis = VisPolyRdw(algorithm='numpy')
+    physical = CompiledEnv(space.border, space.obstacle_list)
+    virtual = CompiledEnv(space.border)
+    return vis.get_vis_polys, [(Vec2(x, y), physical, virtual, a) for x, y, a in poses]
+
+def compute_slices_setup(space, poses, controller_file):
+    vis = VisPolyRdw(algorithm='numpy')
+    env = CompiledEnv(space.border, space.obstacle_list)
+    polys = [vis.get_vis_poly(Vec2(x, y), env, a) for x, y, a in poses]
+    return (lambda poly: poly.compute_slices()), [(p,) for p in polys]
+
+def in_obstacle_setup(space, poses, controller_file):
+    return space.in_obstacle, [(x, y) for x, y, a in poses]
+
+def in_obstacle_sdf_setup(space, poses, controller_file):
+    space.build_sdf()
+    return space.in_obstacle, [(x, y) for x, y, a in poses]
+
+def frames_to_collision_setup(space, poses, controller_file):
+    # look 50 frames ahead along three candidate arcs
+    grid = space.segment_grid()
+    gains = ([1.0, MAX_TRANS_GAIN, MAX_TRANS_GAIN], [1.0, MIN_ROT_GAIN, MIN_ROT_GAIN], [0, MIN_CUR_GAIN_R, MIN_CUR_GAIN_R], [1, 1, -1])
+    users = [(UserInfo(x, y, a, 0.02, 0.01), *gains, 50) for x, y, a in poses]
+    return grid.frames_to_collision, users
+
+def calc_move_setup(space, poses, controller_file):
+    users = [(UserInfo(x, y, a, 0.02, 0.01), MAX_TRANS_GAIN, MAX_ROT_GAIN, MIN_CUR_GAIN_R, 1) for x, y, a in poses]
+    return calc_move_with_gain, users
+
+def calc_gain_setup(space, poses, controller_file):
+    controller = load_controller(controller_file)
+    compiled = space
+    if controller.prepare_space is not None:
+        compiled = controller.prepare_space(space)
+    users = [(UserInfo(x, y, a, 0.02, 0.01), compiled, DELTA_T) for x, y, a in poses]
+    return controller.calc_gain, users
+
+CASES = [
+    Case("get_vis_poly[raycast]", vis_poly_case('raycast'), max_size=300),
+    Case("get_vis_poly[sweep]", vis_poly_case('sweep')),
+    Case("get_vis_poly[numpy]", vis_poly_case('numpy')),
+    Case("get_vis_poly[incremental]", incremental_setup),
+    Case("get_vis_poly[simplified]", simplified_setup),
+    Case("get_vis_polys[fused]", fused_setup),
+    Case("compute_slices", compute_slices_setup),
+    Case("in_obstacle", in_obstacle_setup),
+    Case("in_obstacle[sdf]", in_obstacle_sdf_setup),
+    Case("frames_to_collision", frames_to_collision_setup),
+    Case("calc_move_with_gain", calc_move_setup),
+    Case("calc_gain", calc_gain_setup, max_size=300),
+]
+
+# largest vertex difference to the ray caster accepted per backend
+CHECK_TOLERANCE = {"sweep": 1e-9, "numpy": 1e-9}
+
+def overlapping_room():
+    # obstacles crossing each other and the border, which the sweep cannot order
+    border = [(0, 0), (10, 0), (10, 8), (0, 8)]
+    obstacles = [[(2, 2), (4, 2), (4, 4), (2, 4)], [(3, 3), (5, 3), (5, 5), (3, 5)], [(6, 1), (8, 3), (6, 5)],
+                 [(7, 2), (9, 2), (9, 6), (7, 6)], [(9.5, 7), (11, 7), (11, 9), (9.5, 9)]]
+    return room_space({"border": [{"x": x, "y": y} for x, y in border],
+                       "obstacle_list": [[{"x": x, "y": y} for x, y in obs] for obs in obstacles]}, 1)
+
+def check_backends(spaces, n_poses, seed):
+    """
+    Largest vertex difference of every backend to the ray caster over the rooms ({name: Space}),
+    inf when the vertex counts differ. Return {(room, backend): difference}.
+    """
+    rng = np.random.default_rng(seed)
+    diffs = {}
+    for room, space in spaces.items():
+        env = CompiledEnv(space.border, space.obstacle_list)
+        reference = VisPolyRdw(algorithm='raycast')
+        for algorithm in CHECK_TOLERANCE:
+            vis = VisPolyRdw(algorithm=algorithm)
+            worst = 0.0
+            for x, y, a in free_poses(space, n_poses, rng):
+                expected = reference.get_vis_poly(Vec2(x, y), env, a).vert_array
+                got = vis.get_vis_poly(Vec2(x, y), env, a).vert_array
+                if len(got.x) != len(expected.x):
+                    worst = math.inf
+                    break
+                worst = max(worst, float(np.abs(got.x - expected.x).max(initial=0.0)), float(np.abs(got.y - expected.y).max(initial=0.0)))
+            diffs[(room, algorithm)] = worst
+    return diffs
+
+def simplify_error(xs, ys, keep):
+    # largest distance of a dropped vertex to the edge between the kept vertices around it
+    worst = 0.0
+    for i, k in enumerate(keep):
+        a, b = k, keep[(i + 1) % len(keep)]
+        for j in range(a + 1, b if b > a else b + len(xs)):
+            j %= len(xs)
+            dx, dy = xs[b] - xs[a], ys[b] - ys[a]
+            t = min(1.0, max(0.0, ((xs[j] - xs[a]) * dx + (ys[j] - ys[a]) * dy) / (dx * dx + dy * dy)))
+            worst = max(worst, math.hypot(xs[a] + t * dx - xs[j], ys[a] + t * dy - ys[j]))
+    return worst
+
+def check_simplify(spaces, n_poses, seed, tolerance=SIMPLIFY_TOLERANCE):
+    """
+    Largest simplify error (simplify_error) over convex polygons, which must keep every vertex, and the
+    visibility polygons of the rooms; inf when simplify fails or drops a vertex of a convex polygon.
+    Return {case: error}.
+    """
+    rng = np.random.default_rng(seed)
+    errors = {}
+    for sides in (5, 8, 12):
+        poly = VisibilityPolygon([Vec2(math.cos(2 * math.pi * k / sides), math.sin(2 * math.pi * k / sides)) for k in range(sides)], Vec2(0, 0), 0.0)
+        try:
+            removed = poly.simplify(tolerance)
+        except Exception:
+            removed = None
+        errors[f"convex {sides}"] = 0.0 if removed == 0 else math.inf
+    vis = VisPolyRdw(algorithm='numpy')
+    for room, space in spaces.items():
+        env = CompiledEnv(space.border, space.obstacle_list)
+        worst = 0.0
+        for x, y, a in free_poses(space, n_poses, rng):
+            verts = vis.get_vis_poly(Vec2(x, y), env, a).vert_array
+            xs, ys = verts.x.tolist(), verts.y.tolist()
+            worst = max(worst, simplify_error(xs, ys, simplify_ring(verts.x, verts.y, tolerance).tolist()))
+        errors[room] = worst
+    return errors
+
+def fit_exponent(sizes, p50s):
+    if len(sizes) < 2:
+        return None
+    slope, _ = np.polyfit(np.log(sizes), np.log(p50s), 1)
+    return float(slope)
+
+def run(cases, sizes, budget, n_poses, seed, controller_file):
+    results = {}
+    for case in cases:
+        entry = {"sizes": {}}
+        for n in sizes:
+            if case.max_size is not None and n > case.max_size:
+                continue
+            rng = np.random.default_rng(seed)
+            space = room_space(synthetic_room(n, seed), 1)
+            fn, args_list = case.setup(space, free_poses(space, n_poses, rng), controller_file)
+            times = measure(fn, args_list, budget)
+            entry["sizes"][str(n)] = {
+                "calls": len(times),
+                "p50_ms": float(np.percentile(times, 50) * 1000),
+                "p99_ms": float(np.percentile(times, 99) * 1000),
+                "mean_ms": float(times.mean() * 1000),
+            }
+            print(f"{case.name:<24} n={n:<5} p50 {entry['sizes'][str(n)]['p50_ms']:10.4f} ms   "
+                  f"p99 {entry['sizes'][str(n)]['p99_ms']:10.4f} ms   ({len(times)} calls)", flush=True)
+        ns = [int(n) for n in entry["sizes"]]
+        entry["exponent"] = fit_exponent(ns, [entry["sizes"][str(n)]["p50_ms"] for n in ns])
+        if entry["exponent"] is not None:
+            print(f"{case.name:<24} fitted complexity ~ n^{entry['exponent']:.2f}", flush=True)
+        results[case.name] = entry
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Print p50 ratios against the baseline; return the list of (case, size, ratio) above threshold.
+    """
+    regressions = []
+    for name, entry in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            continue
+        for n, stats in entry["sizes"].items():
+            if n not in old["sizes"]:
+                continue
+            ratio = stats["p50_ms"] / old["sizes"][n]["p50_ms"]
+            flag = "REGRESSION" if ratio > threshold else ""
+            print(f"{name:<24} n={n:<5} p50 x{ratio:6.2f} vs baseline {flag}")
+            if ratio > threshold:
+                regressions.append((name, int(n), ratio))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes',default=",".join(str(n) for n in SIZES),help='segment counts, comma separated')
+    parser.add_argument('--cases',default=None,help='only run cases whose name contains one of these, comma separated')
+    parser.add_argument('--budget',type=float,default=0.5,help='seconds per case and size')
+    parser.add_argument('--poses',type=int,default=50)
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('-f','--file',default='controller/client_logic.py',help='controller used by the calc_gain case')
+    parser.add_argument('--out',help='save the results to this JSON file')
+    parser.add_argument('--baseline',help='compare with the results in this JSON file')
+    parser.add_argument('--threshold',type=float,default=1.25,help='p50 ratio reported as a regression')
+    parser.add_argument('--check',default=False,action='store_true',help='compare the visibility backends instead of timing them')
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.sizes.split(",")]
+    if args.check:
+        spaces = {f"n={n}": room_space(synthetic_room(n, args.seed + 1), 1) for n in sizes if n <= 300}
+        spaces["overlapping"] = overlapping_room()
+        failed = False
+        for (room, algorithm), diff in check_backends(spaces, args.poses, args.seed).items():
+            ok = diff <= CHECK_TOLERANCE[algorithm]
+            failed = failed or not ok
+            print(f"{'ok' if ok else 'DIFF':<4} {algorithm:<8} {room:<12} max vertex diff {diff:.3g}")
+        for case, error in check_simplify(spaces, args.poses, args.seed).items():
+            ok = error <= SIMPLIFY_TOLERANCE
+            failed = failed or not ok
+            print(f"{'ok' if ok else 'DIFF':<4} {'simplify':<8} {case:<12} max dropped vertex distance {error:.3g}")
+        sys.exit(1 if failed else 0)
+
+    cases = CASES
+    if args.cases:
+        wanted = args.cases.split(",")
+        cases = [c for c in CASES if any(w in c.name for w in wanted)]
+    results = run(cases, sizes, args.budget, args.poses, args.seed, args.file)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "numpy": np.__version__,
+                "created": time.time(),
+                "results": results,
+            }, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
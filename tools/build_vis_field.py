@@ -0,0 +1,32 @@
+"""
+Precompute the visibility field of a room (vis_poly_rdw/vis_field.py) for the default controller.
+
+    python -m tools.build_vis_field --room room.json
+    python -m tools.build_vis_field --room room.json --spacing 0.05 --workers 8
+
+The field is saved under --out (default vis_fields/) in a directory named after a hash of
+the room, which is where prepare_space looks it up when a session starts with that room.
+Use the same --meter-per-px as the server so that the room, and therefore the hash, match.
+"""
+import argparse
+import time
+from utils.constants import *
+from utils.rooms import load_room, room_space
+from vis_poly_rdw.vis_field import FIELD_DIR, SPACING, build_field
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--room',required=True,help='room JSON (start message or its "physical" part)')
+    parser.add_argument('--meter-per-px',type=float,default=METER_PER_PX)
+    parser.add_argument('--spacing',type=float,default=SPACING,help='grid spacing in m')
+    parser.add_argument('--out',default=FIELD_DIR)
+    parser.add_argument('--workers',type=int,default=None)
+    parser.add_argument('--algorithm',default='numpy',choices=('raycast','sweep','numpy'))
+    args = parser.parse_args()
+
+    space = room_space(load_room(args.room), args.meter_per_px)
+    t = time.time()
+    field = build_field(space, args.spacing, args.out, args.workers, args.algorithm)
+    slices = sum(len(s) for s in field.slices.values())
+    print(f"{field.directory}: {field.nx} x {field.ny} cells, {field.meta['free_cells']} free, "
+          f"{slices} slices, built in {time.time() - t:.1f} s")
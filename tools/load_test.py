@@ -0,0 +1,240 @@
+"""
+Load-test a running client_base.py server without the web front end.
+
+    python client_base.py -q &
+    python -m tools.load_test --sessions 1,2,4,8,16 --fps 50 --duration 10
+    python -m tools.load_test --sessions 4 --room room.json --path trace --path-file recordings/20261018-101500-123456
+
+Every session opens its own websocket connection and plays the front end: it sends the start
+message with the room, then running frames at --fps, and ends with the end message. The
+walk comes from utils.paths (a random walk per session by default, or waypoints or a
+recorded trace). Replies are applied like the front end does: running-gain replies move the
+user with calc_move_with_gain, running replies (universal mode, -u on the server, and
+resets) set the pose, and a pose inside an obstacle makes the next frame a reset frame.
+Both server modes are therefore covered without a client option.
+
+A session keeps at most --in-flight frames without a reply (1: every frame waits for the
+reply to the previous one; more lets frames queue up on the server, which needs the default
+fifo schedule to pair the replies with their frames). A frame that is due while that many
+are in flight is sent late.
+
+Every --sessions value is one step of --duration seconds. A step reports the round-trip time
+from sending a frame to receiving its reply, the achieved throughput against the offered load
+(sessions x fps), and the frames sent late. The first step whose throughput falls below
+--saturation of the offered load, or whose p99 round trip exceeds the frame interval, is
+reported as the saturation point.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+import websockets
+from utils.constants import *
+from utils.latency import LatencyHistogram
+from utils.misc import calc_move_with_gain
+from utils.paths import PATH_KINDS, make_path
+from utils.rooms import load_room, rectangle_room, room_space
+from utils.simulation import random_starts
+from utils.space import UserInfo
+from utils.wire import PROTOCOL_BINARY, encode_running, decode_reply
+
+class StepResult:
+    """
+    Statistics of one load step: rtt is a LatencyHistogram of the round-trip times (s).
+    """
+    def __init__(self, sessions, fps):
+        self.sessions = sessions
+        self.fps = fps
+        self.rtt = LatencyHistogram()
+        self.sent = 0
+        self.late = 0
+        self.resets = 0
+        self.connected = 0
+        # the running phase: from the moment every session has started to the last reply
+        self.began = None
+        self.ended = None
+
+    @property
+    def elapsed(self):
+        return self.ended - self.began if self.began is not None and self.ended is not None else 0.0
+
+    @property
+    def offered(self):
+        return self.sessions * self.fps
+
+    @property
+    def throughput(self):
+        return self.rtt.count / self.elapsed if self.elapsed > 0 else 0.0
+
+    def saturated(self, fraction):
+        return self.throughput < fraction * self.offered or self.rtt.percentile(99) > 1 / self.fps
+
+    def summary(self):
+        rtt = self.rtt.as_dict()
+        return {
+            "sessions": self.sessions,
+            "offered_fps": self.offered,
+            "throughput_fps": self.throughput,
+            "sent": self.sent,
+            "replies": self.rtt.count,
+            "late": self.late,
+            "resets": self.resets,
+            "rtt_ms": {key: rtt[key] for key in ("mean", "p50", "p90", "p99", "p999", "max")},
+        }
+
+async def run_session(url, room, space, start, path, args, result, ready):
+    meter_per_px = args.meter_per_px
+    delta_t = 1 / args.fps
+    x, y, angle = start
+    need_reset = False
+    async with websockets.connect(url, max_queue=None) as websocket:
+        message = {"type": "start", "physical": room}
+        if args.binary:
+            message["protocol"] = PROTOCOL_BINARY
+        await websocket.send(json.dumps(message))
+        binary = json.loads(await websocket.recv()).get("protocol") == PROTOCOL_BINARY
+        # frames only start once every session of the step is connected
+        result.connected += 1
+        if result.connected == result.sessions:
+            result.began = time.perf_counter()
+            ready.set()
+        await ready.wait()
+        deadline = result.began + args.duration
+
+        # send times of the frames without a reply, oldest first
+        in_flight = deque()
+        done = asyncio.Event()
+        slot = asyncio.Event()
+        slot.set()
+        latest = [None]
+
+        async def receive():
+            async for data in websocket:
+                reply = decode_reply(data) if isinstance(data, bytes) else json.loads(data)
+                if reply["type"] not in ("running", "running-gain"):
+                    continue
+                now = time.perf_counter()
+                result.rtt.record(now - in_flight.popleft())
+                result.ended = max(result.ended or now, now)
+                latest[0] = reply
+                slot.set()
+                if not in_flight and done.is_set():
+                    return
+
+        receiver = asyncio.ensure_future(receive())
+        frames = path.frames(delta_t)
+        clock = time.perf_counter
+        next_time = clock()
+        while clock() < deadline:
+            try:
+                v, w = next(frames)
+            except StopIteration:
+                break
+            # the front end moves the user with the newest reply it has
+            reply, latest[0] = latest[0], None
+            if reply is not None:
+                if reply["type"] == "running":
+                    x, y, angle = reply["user_x"] * meter_per_px, reply["user_y"] * meter_per_px, reply["user_direction"]
+                    result.resets += bool(reply["reset"])
+                else:
+                    cur_gain = reply["cur_gain"]
+                    user = calc_move_with_gain(UserInfo(x, y, angle, v, w), reply["trans_gain"], reply["rot_gain"], abs(cur_gain), -1 if cur_gain < 0 else 1)
+                    x, y, angle = user.x, user.y, user.angle
+                need_reset = space.in_obstacle(x, y)
+            await asyncio.sleep(max(0.0, next_time - clock()))
+            while len(in_flight) >= args.in_flight:
+                slot.clear()
+                await slot.wait()
+            if clock() > next_time + delta_t:
+                result.late += 1
+            frame = (x / meter_per_px, y / meter_per_px, angle, v / meter_per_px, w, delta_t, need_reset)
+            if binary:
+                data = encode_running(*frame)
+            else:
+                data = json.dumps({
+                    "type": "running",
+                    "physical": {"user_x": frame[0], "user_y": frame[1], "user_direction": angle},
+                    "user_v": frame[3],
+                    "user_w": w,
+                    "delta_t": delta_t,
+                    "need_reset": need_reset,
+                })
+            in_flight.append(clock())
+            await websocket.send(data)
+            result.sent += 1
+            need_reset = False
+            next_time = max(next_time + delta_t, clock() - delta_t)
+
+        done.set()
+        if in_flight:
+            # the last replies; a server that skips frames (--schedule latest) never sends some of them
+            await asyncio.wait([receiver], timeout=1.0)
+        receiver.cancel()
+        try:
+            await receiver
+        except asyncio.CancelledError:
+            pass
+        await websocket.send(json.dumps({"type": "end"}))
+        async for data in websocket:
+            if isinstance(data, str) and json.loads(data)["type"] == "end":
+                break
+
+async def run_step(n, room, space, args):
+    result = StepResult(n, args.fps)
+    x, y, angle = random_starts(space, n, args.seed)
+    ready = asyncio.Event()
+    await asyncio.gather(*[run_session(args.url, room, space, (float(x[i]), float(y[i]), float(angle[i])),
+                                       make_path(args.path, args.path_file, args.seed + i), args, result, ready)
+                           for i in range(n)])
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url',default='ws://localhost:8765')
+    parser.add_argument('--sessions',default='1',help='concurrent sessions of every step, comma separated (e.g. 1,2,4,8)')
+    parser.add_argument('--fps',type=float,default=1 / DELTA_T,help='running frames per second of every session')
+    parser.add_argument('--duration',type=float,default=10.0,help='seconds per step')
+    parser.add_argument('--in-flight',type=int,default=1,help='frames a session may send before the reply to the oldest one')
+    parser.add_argument('--room',help='room JSON (start message or its "physical" part), default: 10m x 10m empty room')
+    parser.add_argument('--meter-per-px',type=float,default=METER_PER_PX)
+    parser.add_argument('--path',choices=PATH_KINDS,default='random')
+    parser.add_argument('--path-file',help='waypoints JSON or recorded (v, w) trace; a recorded session also provides the room')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--binary',default=False,action='store_true',help='negotiate the binary protocol for running frames')
+    parser.add_argument('--saturation',type=float,default=0.95,help='a step is saturated below this fraction of the offered load')
+    parser.add_argument('--json',help='also write the results to this file')
+    args = parser.parse_args()
+    if args.path != "random" and args.path_file is None:
+        parser.error(f"--path {args.path} needs --path-file")
+
+    if args.room:
+        room = load_room(args.room)
+    elif args.path == "trace" and args.path_file and os.path.isdir(args.path_file):
+        # a session recorded by client_base --record, replayed in its own room
+        room = load_room(os.path.join(args.path_file, "meta.json"))
+    else:
+        room = rectangle_room(10, 10, args.meter_per_px)
+    space = room_space(room, args.meter_per_px)
+
+    results = []
+    saturation = None
+    for n in [int(s) for s in args.sessions.split(",")]:
+        try:
+            result = asyncio.run(run_step(n, room, space, args))
+        except OSError as e:
+            raise SystemExit(f"cannot reach the server at {args.url}: {e}")
+        rtt = result.rtt
+        print(f"{n:>4} sessions: {result.throughput:9.1f} / {result.offered:9.1f} fps, rtt p50 {rtt.percentile(50) * 1000:8.3f} ms "
+              f"p99 {rtt.percentile(99) * 1000:8.3f} ms max {rtt.max * 1000:8.3f} ms, late {result.late}, resets {result.resets}")
+        results.append(result.summary())
+        if saturation is None and result.saturated(args.saturation):
+            saturation = n
+    if saturation is None:
+        print("not saturated")
+    else:
+        print(f"saturated at {saturation} sessions, best throughput {max(r['throughput_fps'] for r in results):.1f} fps")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"saturation_sessions": saturation, "steps": results}, f, indent=2)
@@ -0,0 +1,48 @@
+"""
+Replay recorded sessions (client_base --record) through a controller, for regression testing.
+
+    python -m tools.replay recordings/20261018-101500-123456 -f controller/client_logic.py
+    python -m tools.replay recordings -f controller/client_logic.py --tolerance 1e-9
+
+Given a directory of sessions, every session in it is replayed. Exits with status 1 when an
+output differs from the recording by more than --tolerance.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+from utils.controller import load_controller
+from utils.trace import TraceReader, find_sessions, replay
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace',help='a session directory or a directory of sessions')
+    parser.add_argument('-u','--universal',help='Enable universal interface',default=False,action='store_true')
+    parser.add_argument('-f','--file',default='controller/client_logic.py')
+    parser.add_argument('--start',type=int,default=0)
+    parser.add_argument('--stop',type=int,default=None)
+    parser.add_argument('--tolerance',type=float,default=1e-6)
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.trace, "meta.json")):
+        sessions = [args.trace]
+    else:
+        sessions = find_sessions(args.trace)
+    failed = False
+    for session in sessions:
+        reader = TraceReader(session)
+        # a fresh controller instance per session, as for a new websocket connection
+        controller = load_controller(args.file, args.universal)
+        result = replay(reader, controller, args.start, args.stop)
+        diff = result.max_diff(reader)
+        worst = max(diff.values()) if diff else 0.0
+        status = "ok" if worst <= args.tolerance else "DIFF"
+        failed = failed or status != "ok"
+        times = result.compute_times if len(result.compute_times) > 0 else np.zeros(1)
+        print(f"{status:<4} {session}: {len(times)} frames, compute mean {times.mean() * 1000:.3f} ms, "
+              f"p99 {np.percentile(times, 99) * 1000:.3f} ms, max diff {worst:.3g}")
+        if status != "ok":
+            for name, d in diff.items():
+                if d > args.tolerance:
+                    print(f"     {name}: {d:.6g}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,50 @@
+"""
+Run a controller offline, without the web front end.
+
+    python -m tools.simulate -f controller/client_logic.py --frames 50000
+    python -m tools.simulate -u -f controller/client_logic_universal.py --room room.json --path random --seed 3
+    python -m tools.simulate --crowd 10000 --frames 500
+
+--crowd N moves N random walkers at once through the room with vectorized steer-to-center
+gains (utils.simulation.simulate_crowd) instead of running the controller.
+"""
+import argparse
+import json
+from utils.constants import *
+from utils.controller import load_controller
+from utils.rooms import load_room, rectangle_room, room_space
+from utils.paths import PATH_KINDS, RandomWalkBatch, make_path
+from utils.simulation import simulate, simulate_crowd, random_starts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-u','--universal',help='Enable universal interface',default=False,action='store_true')
+    parser.add_argument('-f','--file',default='controller/client_logic.py')
+    parser.add_argument('--room',help='room JSON (start message or its "physical" part), default: 10m x 10m empty room')
+    parser.add_argument('--meter-per-px',type=float,default=METER_PER_PX)
+    parser.add_argument('--path',choices=PATH_KINDS,default='random')
+    parser.add_argument('--path-file',help='waypoints JSON or recorded (v, w) trace')
+    parser.add_argument('--frames',type=int,default=10000)
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--dt',type=float,default=DELTA_T)
+    parser.add_argument('--json',help='also write the summary to this file')
+    parser.add_argument('--crowd',type=int,default=0,help='simulate this many random walkers at once, without the controller')
+    args = parser.parse_args()
+    if args.path != "random" and args.path_file is None:
+        parser.error(f"--path {args.path} needs --path-file")
+
+    room = load_room(args.room) if args.room else rectangle_room(10, 10, args.meter_per_px)
+    space = room_space(room, args.meter_per_px)
+    if args.crowd > 0:
+        starts = random_starts(space, args.crowd, args.seed)
+        result = simulate_crowd(space, RandomWalkBatch(args.crowd, args.seed), args.frames, starts, delta_t=args.dt)
+    else:
+        controller = load_controller(args.file, args.universal)
+        result = simulate(controller, space, make_path(args.path, args.path_file, args.seed), args.frames, args.dt)
+
+    summary = result.summary()
+    for key, value in summary.items():
+        print(f"{key:>20}: {value:.6g}" if isinstance(value, float) else f"{key:>20}: {value}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,140 @@
+"""
+Batch experiments: simulate every controller x room x seed combination in a process pool.
+
+Every finished run is appended as one JSON line to a checkpoint file, so an
+interrupted batch resumes where it stopped and the checkpoint doubles as the
+streamed result table.
+"""
+import csv
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from tqdm import tqdm
+from utils.constants import *
+from utils.controller import load_controller
+from utils.rooms import load_room, room_space
+from utils.paths import RandomWalk
+from utils.simulation import simulate
+
+class RunConfig:
+    def __init__(self, controller, universal, room, seed, frames, delta_t = DELTA_T, meter_per_px = METER_PER_PX):
+        self.controller = controller
+        self.universal = universal
+        self.room = room
+        self.seed = seed
+        self.frames = frames
+        self.delta_t = delta_t
+        self.meter_per_px = meter_per_px
+
+    @property
+    def key(self):
+        # every field that changes the result, so a checkpoint is only reused for the same run
+        return "|".join(str(v) for v in self.as_dict().values())
+
+    def as_dict(self):
+        return {
+            "controller": self.controller,
+            "mode": "universal" if self.universal else "gain",
+            "room": self.room,
+            "seed": self.seed,
+            "frames": self.frames,
+            "delta_t": self.delta_t,
+            "meter_per_px": self.meter_per_px,
+        }
+
+def make_grid(controllers, rooms, seeds, frames, delta_t = DELTA_T, meter_per_px = METER_PER_PX):
+    """
+    controllers: list of (file, universal) pairs, rooms: list of room JSON files, seeds: iterable of ints.
+    """
+    return [RunConfig(c, u, r, s, frames, delta_t, meter_per_px) for (c, u), r, s in product(controllers, rooms, seeds)]
+
+def run_one(config):
+    """
+    Worker entry point: one simulation, returned as a flat result row. Failures are reported in the
+    row instead of raised, so one broken configuration does not stop the batch.
+    """
+    row = config.as_dict()
+    row["key"] = config.key
+    try:
+        controller = load_controller(config.controller, config.universal)
+        space = room_space(load_room(config.room), config.meter_per_px)
+        result = simulate(controller, space, RandomWalk(config.seed), config.frames, config.delta_t)
+        row.update(result.summary())
+        row["error"] = ""
+    except Exception:
+        row["error"] = traceback.format_exc(limit=3)
+    return row
+
+def load_checkpoint(file_name):
+    rows = {}
+    if file_name is not None and os.path.exists(file_name):
+        with open(file_name) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # a run interrupted while writing its line, it is simply redone
+                    continue
+                rows[row["key"]] = row
+    return rows
+
+def run_batch(configs, checkpoint = None, workers = None, retry_errors = False):
+    """
+    Run all configs not yet in the checkpoint file and return every result row (old and new).
+    workers defaults to the number of CPU cores.
+    """
+    done = load_checkpoint(checkpoint)
+    if retry_errors:
+        done = {k: row for k, row in done.items() if not row.get("error")}
+    pending = [c for c in configs if c.key not in done]
+    rows = [done[c.key] for c in configs if c.key in done]
+
+    out = open(checkpoint, "a") if checkpoint is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = [executor.submit(run_one, c) for c in pending]
+            for future in tqdm(as_completed(futures), total=len(futures), initial=0, desc="runs"):
+                row = future.result()
+                rows.append(row)
+                if out is not None:
+                    out.write(json.dumps(row) + "\n")
+                    out.flush()
+    finally:
+        if out is not None:
+            out.close()
+    return rows
+
+AGGREGATE_FIELDS = ("resets_per_meter", "compute_mean_ms", "compute_p99_ms", "fps")
+
+def aggregate(rows):
+    """
+    Mean of AGGREGATE_FIELDS over seeds, one row per controller x mode x room.
+    """
+    groups = {}
+    for row in rows:
+        if row.get("error"):
+            continue
+        groups.setdefault((row["controller"], row["mode"], row["room"]), []).append(row)
+    table = []
+    for (controller, mode, room), group in sorted(groups.items()):
+        entry = {"controller": controller, "mode": mode, "room": room, "runs": len(group)}
+        for field in AGGREGATE_FIELDS:
+            entry[field] = sum(r[field] for r in group) / len(group)
+        table.append(entry)
+    return table
+
+def write_csv(rows, file_name):
+    if not rows:
+        return
+    fields = list(rows[0].keys())
+    for row in rows[1:]:
+        fields.extend(k for k in row.keys() if k not in fields)
+    with open(file_name, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -1,5 +1,6 @@
 
 DELTA_T=0.02 # 50 fps
+METER_PER_PX=5/200 # scale of the coordinates sent by the web front end
 MIN_TRANS_GAIN=0.86
 MAX_TRANS_GAIN=1.26
 MIN_ROT_GAIN=0.67
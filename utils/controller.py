@@ -0,0 +1,119 @@
+import importlib.util
+import os
+import types
+
+def import_module_from_file(file_name):
+    if not os.path.exists(file_name):
+        return None
+
+    spec = importlib.util.spec_from_file_location("temp_module", file_name)
+    if spec is None:
+        return None
+
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def get_function(module, function_name):
+    if module is not None and function_name in dir(module):
+        function = getattr(module, function_name)
+        return function
+    else:
+        return None
+
+def import_function_from_file(file_name, function_name):
+    return get_function(import_module_from_file(file_name), function_name)
+
+class ControllerSource:
+    """
+    A controller file compiled once. instantiate() executes the cached code object as a fresh module,
+    without reading or compiling the file again; the libraries it imports are already loaded after the
+    first instance, so a new instance costs only the module body.
+    version is incremented every time the code is (re)compiled.
+    """
+    def __init__(self, file_name):
+        if not os.path.exists(file_name):
+            raise FileNotFoundError(f"cannot load controller from {file_name}")
+        self.file_name = file_name
+        self.version = 0
+        self.mtime = None
+        self.code = None
+        self.load()
+
+    def load(self):
+        mtime = os.stat(self.file_name).st_mtime_ns
+        with open(self.file_name, "rb") as f:
+            source = f.read()
+        # the mtime is taken first, a write during the read shows up as a change next time
+        self.mtime = mtime
+        self.code = compile(source, self.file_name, "exec")
+        self.version += 1
+
+    def changed(self):
+        try:
+            return os.stat(self.file_name).st_mtime_ns != self.mtime
+        except OSError:
+            # being replaced by an editor, look again later
+            return False
+
+    def reload(self):
+        """
+        Recompile the file if it changed. Return True when the code was replaced; a file that does not
+        compile is reported and the previous code is kept.
+        """
+        if not self.changed():
+            return False
+        try:
+            self.load()
+        except (SyntaxError, OSError) as e:
+            print(f"controller {self.file_name} not reloaded: {e}")
+            return False
+        return True
+
+    def instantiate(self):
+        module = types.ModuleType("temp_module")
+        module.__file__ = self.file_name
+        exec(self.code, module.__dict__)
+        return module
+
+# compiled controller files of this process, by file name
+_sources = {}
+
+def controller_source(file_name):
+    """
+    The ControllerSource of file_name, compiled on first use and recompiled when the file changed.
+    """
+    source = _sources.get(file_name)
+    if source is None:
+        source = _sources[file_name] = ControllerSource(file_name)
+    else:
+        source.reload()
+    return source
+
+class Controller:
+    """
+    The entry points of one instance of a controller module.
+    calc_gain is used in gain mode, update_user in universal mode (-u); prepare_space is optional.
+    """
+    def __init__(self, module, universal = False):
+        self.module = module
+        self.universal = universal
+        self.prepare_space = get_function(module, "prepare_space")
+        self.calc_gain = get_function(module, "calc_gain")
+        self.update_user = get_function(module, "update_user")
+        self.update_reset = get_function(module, "update_reset")
+
+    def missing(self):
+        # names of the entry points this mode needs but the module does not define
+        required = "update_user" if self.universal else "calc_gain"
+        return [name for name in (required, "update_reset") if getattr(self, name) is None]
+
+def load_controller(file_name, universal = False):
+    """
+    A fresh instance of the controller module in file_name, the same way client_base loads it.
+    The file is compiled once per process, see controller_source.
+    """
+    controller = Controller(controller_source(file_name).instantiate(), universal)
+    for name in controller.missing():
+        raise AttributeError(f"controller {file_name} does not define {name}")
+    return controller
@@ -0,0 +1,141 @@
+"""
+Latency instrumentation for the websocket loop.
+
+LatencyHistogram is a streaming histogram with logarithmic buckets: O(1) record,
+constant memory, and percentiles accurate to the bucket width (about 6% with the
+default 40 buckets per decade). FrameStats keeps one histogram per stage of a
+frame (queue, parse, compute, serialize, send) plus the total, and counts the frames
+the scheduler dropped as stale or answered with the previous gains (degraded).
+"""
+import json
+import math
+import time
+from utils.constants import *
+
+class LatencyHistogram:
+    def __init__(self, min_value = 1e-6, max_value = 100.0, buckets_per_decade = 40):
+        self.min_value = min_value
+        self.log_min = math.log10(min_value)
+        self.scale = buckets_per_decade
+        # bucket 0 is everything <= min_value, the last one everything above max_value
+        self.counts = [0] * (int(math.ceil((math.log10(max_value) - self.log_min) * buckets_per_decade)) + 2)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, value):
+        if value <= self.min_value:
+            i = 0
+        else:
+            i = min(len(self.counts) - 1, 1 + int((math.log10(value) - self.log_min) * self.scale))
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """
+        Upper edge of the bucket holding the p-th percentile (0 < p <= 100), clamped to the observed range.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(math.ceil(p / 100 * self.count)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                edge = 10 ** (self.log_min + i / self.scale)
+                return min(max(edge, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def as_dict(self, unit = 1000.0):
+        # times in ms by default
+        return {
+            "count": self.count,
+            "mean": self.mean * unit,
+            "p50": self.percentile(50) * unit,
+            "p90": self.percentile(90) * unit,
+            "p99": self.percentile(99) * unit,
+            "p999": self.percentile(99.9) * unit,
+            "max": self.max * unit,
+        }
+
+STAGES = ("queue", "parse", "compute", "serialize", "send", "total")
+
+class FrameStats:
+    """
+    Per-session frame timing. Call record() once per running frame with the seconds spent in every stage
+    (queue is the time a received frame waited before being handled); frames whose total exceeds budget
+    (DELTA_T by default) are counted as over budget.
+    """
+    def __init__(self, budget = DELTA_T):
+        self.budget = budget
+        self.stages = {name: LatencyHistogram() for name in STAGES}
+        self.frames = 0
+        self.over_budget = 0
+        # running frames skipped because a newer one was waiting, and frames answered with the previous gains
+        self.dropped = 0
+        self.degraded = 0
+        self.started = time.time()
+
+    def record(self, parse, compute, serialize, send, queue = 0.0, total = None):
+        # total defaults to the sum of the stages, pass it when the stages do not cover the whole frame
+        if total is None:
+            total = queue + parse + compute + serialize + send
+        stages = self.stages
+        stages["queue"].record(queue)
+        stages["parse"].record(parse)
+        stages["compute"].record(compute)
+        stages["serialize"].record(serialize)
+        stages["send"].record(send)
+        stages["total"].record(total)
+        self.frames += 1
+        if total > self.budget:
+            self.over_budget += 1
+
+    def drop(self, count = 1):
+        self.dropped += count
+
+    def as_dict(self):
+        elapsed = time.time() - self.started
+        return {
+            "frames": self.frames,
+            "elapsed": elapsed,
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+            "budget_ms": self.budget * 1000,
+            "over_budget": self.over_budget,
+            "dropped": self.dropped,
+            "degraded": self.degraded,
+            "stages_ms": {name: h.as_dict() for name, h in self.stages.items()},
+        }
+
+    def summary(self):
+        # one line for the console
+        total = self.stages["total"]
+        compute = self.stages["compute"]
+        return (f"frames {self.frames}, over budget {self.over_budget}, dropped {self.dropped}, degraded {self.degraded}, "
+                f"total p50 {total.percentile(50) * 1000:.3f} ms p99 {total.percentile(99) * 1000:.3f} ms max {total.max * 1000:.3f} ms, "
+                f"compute p50 {compute.percentile(50) * 1000:.3f} ms p99 {compute.percentile(99) * 1000:.3f} ms")
+
+    def export(self, file_name, **extra):
+        # append the session as one JSON line
+        record = dict(extra)
+        record.update(self.as_dict())
+        with open(file_name, "a") as f:
+            f.write(json.dumps(record) + "\n")
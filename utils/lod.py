@@ -0,0 +1,81 @@
+"""
+Levels of detail of a physical Space, for rooms scanned or drawn at high resolution.
+
+build_levels cleans the room once, then derives coarser copies of it:
+
+    * the free space is the border minus the union of the obstacles, so overlapping
+      obstacles are merged and the parts outside the border disappear;
+    * only the reachable part of it is kept: the component containing start, by default
+      the largest one. Obstacles in unreachable pockets go away with them, and obstacles
+      touching the border become notches of the border;
+    * every level with a tolerance > 0 drops the obstacles that fit in a circle of that
+      radius and simplifies the remaining rings with shapely's topology-preserving
+      Douglas-Peucker at that tolerance.
+
+Every level is a Space with tolerance and error_bound (m): a point that the level classifies
+differently (free / obstacle) than the reachable room lies within error_bound of its walls.
+The level of tolerance 0 describes the same reachable free space exactly, with fewer segments.
+"""
+import numpy as np
+import shapely
+from shapely.geometry import Point
+from shapely.geometry.polygon import Polygon
+from utils.space import Space
+
+LOD_TOLERANCES = (0.0, 0.02, 0.05, 0.2) # m
+
+class SpaceLevel(Space):
+    """
+    A Space built by build_levels, with the tolerance it was simplified with and its error bound (m).
+    """
+    def __init__(self, region, tolerance, error_bound):
+        border = [{"x": x, "y": y} for x, y in region.exterior.coords[:-1]]
+        obstacles = [[{"x": x, "y": y} for x, y in ring.coords[:-1]] for ring in region.interiors]
+        super().__init__(border, obstacles)
+        self.tolerance = tolerance
+        self.error_bound = error_bound
+
+    def segment_count(self):
+        return len(self.border) + sum(len(obstacle) for obstacle in self.obstacle_list)
+
+def reachable_region(space, start = None):
+    """
+    The polygon (with holes) of the free space of space reachable from start (x, y), or the largest free part.
+    """
+    free = shapely.make_valid(Polygon(space.border))
+    if space.obstacle_list:
+        free = free.difference(shapely.union_all([shapely.make_valid(Polygon(obstacle)) for obstacle in space.obstacle_list]))
+    parts = [part for part in shapely.get_parts(free) if isinstance(part, Polygon) and part.area > 0]
+    if not parts:
+        raise ValueError("the physical space has no free area")
+    if start is not None:
+        point = Point(start)
+        for part in parts:
+            if part.covers(point):
+                return part
+    return max(parts, key=lambda part: part.area)
+
+def _radius(ring):
+    # radius of the smallest circle around the centroid that holds the ring
+    coords = np.asarray(ring.coords)
+    center = np.asarray(Polygon(ring).centroid.coords[0])
+    return float(np.hypot(*(coords - center).T).max())
+
+def build_levels(space, tolerances = LOD_TOLERANCES, start = None):
+    """
+    One SpaceLevel per tolerance (m), in the given order. start: physical (x, y) of the user, if known.
+    """
+    region = reachable_region(space, start)
+    radii = [_radius(ring) for ring in region.interiors]
+    levels = []
+    for tolerance in tolerances:
+        if tolerance <= 0:
+            levels.append(SpaceLevel(region, 0.0, 0.0))
+            continue
+        holes = [ring for ring, r in zip(region.interiors, radii) if r > tolerance]
+        level = Polygon(region.exterior, holes).simplify(tolerance, preserve_topology=True)
+        # Douglas-Peucker keeps every removed vertex within tolerance of the new boundary, and a
+        # dropped obstacle lies within its radius (<= tolerance) of its own walls
+        changed = len(holes) < len(radii) or shapely.get_num_coordinates(level) < shapely.get_num_coordinates(region)
+        levels.append(SpaceLevel(level, tolerance, tolerance if changed else 0.0))
+    return levels
@@ -1,5 +1,6 @@
 from utils.space import *
 import math
+import numpy as np
 
 def calc_move_with_gain(user, trans_gain, rot_gain, cur_gain_r, cur_direction):
     x = user.x
@@ -19,4 +20,33 @@ def calc_move_with_gain(user, trans_gain, rot_gain, cur_gain_r, cur_direction):
     x += d_s * math.cos(dir)
     y += d_s * math.sin(dir)
     
-    return UserInfo(x, y, dir, user.v, user.w)
\ No newline at end of file
+    return UserInfo(x, y, dir, user.v, user.w)
+
+def calc_move_with_gain_batch(users, trans_gain, rot_gain, cur_gain_r, cur_direction, out = None):
+    """
+    calc_move_with_gain for a UserBatch in one vectorized step. The gains are scalars or
+    arrays with one value per user; a curvature radius of 0 disables curvature for that user.
+    Return a new UserBatch, or update x, y and angle of out (which may be users) in place.
+    """
+    d_s = users.v / trans_gain
+    d_dir = users.w / rot_gain
+
+    dir = users.angle + d_dir
+    curving = np.broadcast_to(cur_gain_r != 0, dir.shape)
+    if curving.all():
+        dir += cur_direction * d_s / cur_gain_r
+        np.mod(dir, 2 * math.pi, out=dir)
+    elif curving.any():
+        with np.errstate(divide='ignore', invalid='ignore'):
+            curved = np.mod(dir + cur_direction * d_s / cur_gain_r, 2 * math.pi)
+        dir = np.where(curving, curved, dir)
+
+    x = users.x + d_s * np.cos(dir)
+    y = users.y + d_s * np.sin(dir)
+
+    if out is None:
+        return UserBatch(x, y, dir, users.v, users.w)
+    out.x[...] = x
+    out.y[...] = y
+    out.angle[...] = dir
+    return out
@@ -0,0 +1,161 @@
+"""
+Virtual user paths for offline simulation.
+A path yields the per-frame virtual motion (v, w): v in m/frame, w in rad/frame,
+the same quantities the web front end sends as user_v / user_w.
+"""
+import json
+import math
+import os
+import numpy as np
+
+WALK_SPEED = 1.0 # m/s
+TURN_SPEED = math.pi / 2 # rad/s
+
+class RandomWalk:
+    """
+    Walk straight for a random distance in [min_leg, max_leg] m, then turn on the spot by a random angle.
+    """
+    def __init__(self, seed = None, speed = WALK_SPEED, turn_speed = TURN_SPEED, min_leg = 1.0, max_leg = 8.0):
+        self.rng = np.random.default_rng(seed)
+        self.speed = speed
+        self.turn_speed = turn_speed
+        self.min_leg = min_leg
+        self.max_leg = max_leg
+
+    def frames(self, delta_t):
+        v = self.speed * delta_t
+        while True:
+            leg = self.rng.uniform(self.min_leg, self.max_leg)
+            for _ in range(max(1, int(round(leg / v)))):
+                yield v, 0.0
+            turn = self.rng.uniform(-math.pi, math.pi)
+            w = math.copysign(self.turn_speed * delta_t, turn)
+            for _ in range(int(abs(turn) / abs(w))):
+                yield 0.0, w
+
+class RandomWalkBatch:
+    """
+    RandomWalk for n users at once, each with its own legs and turns:
+    frames() yields (v, w) arrays with one value per user.
+    """
+    def __init__(self, n, seed = None, speed = WALK_SPEED, turn_speed = TURN_SPEED, min_leg = 1.0, max_leg = 8.0):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.speed = speed
+        self.turn_speed = turn_speed
+        self.min_leg = min_leg
+        self.max_leg = max_leg
+
+    def frames(self, delta_t):
+        step = self.speed * delta_t
+        turn_step = self.turn_speed * delta_t
+        v = np.zeros(self.n)
+        w = np.zeros(self.n)
+        # frames left in the current leg or turn of every user
+        left = np.zeros(self.n, dtype=np.int64)
+        walking = np.zeros(self.n, dtype=bool)
+        while True:
+            # a turn may last 0 frames, then the next leg starts in the same frame
+            done = left <= 0
+            while done.any():
+                start_turn = done & walking
+                start_walk = done & ~walking
+                legs = self.rng.uniform(self.min_leg, self.max_leg, int(start_walk.sum()))
+                left[start_walk] = np.maximum(1, np.round(legs / step).astype(np.int64))
+                v[start_walk] = step
+                w[start_walk] = 0.0
+                turns = self.rng.uniform(-math.pi, math.pi, int(start_turn.sum()))
+                left[start_turn] = (np.abs(turns) / turn_step).astype(np.int64)
+                v[start_turn] = 0.0
+                w[start_turn] = np.copysign(turn_step, turns)
+                walking ^= done
+                done = left <= 0
+            left -= 1
+            yield v.copy(), w.copy()
+
+class WaypointPath:
+    """
+    Visit the virtual waypoints [(x, y), ...] in order, starting at the first one facing `heading`:
+    turn on the spot towards the next waypoint, then walk straight to it. Stops after the last waypoint.
+    """
+    def __init__(self, waypoints, heading = 0.0, speed = WALK_SPEED, turn_speed = TURN_SPEED):
+        self.waypoints = [tuple(p) for p in waypoints]
+        self.heading = heading
+        self.speed = speed
+        self.turn_speed = turn_speed
+
+    @classmethod
+    def from_file(cls, file_name, **kwargs):
+        # JSON list of [x, y] in meters
+        with open(file_name) as f:
+            return cls(json.load(f), **kwargs)
+
+    def frames(self, delta_t):
+        heading = self.heading
+        max_v = self.speed * delta_t
+        max_w = self.turn_speed * delta_t
+        for (x0, y0), (x1, y1) in zip(self.waypoints, self.waypoints[1:]):
+            target = math.atan2(y1 - y0, x1 - x0)
+            diff = (target - heading + math.pi) % (2 * math.pi) - math.pi
+            while abs(diff) > 1e-9:
+                w = math.copysign(min(max_w, abs(diff)), diff)
+                diff -= w
+                yield 0.0, w
+            heading = target
+            dist = math.hypot(x1 - x0, y1 - y0)
+            while dist > 1e-9:
+                v = min(max_v, dist)
+                dist -= v
+                yield v, 0.0
+
+class RecordedTrace:
+    """
+    Replay recorded per-frame (v, w) values. Stops at the end of the recording.
+    """
+    def __init__(self, v, w):
+        self.v = np.asarray(v, dtype=float)
+        self.w = np.asarray(w, dtype=float)
+
+    @classmethod
+    def from_file(cls, file_name):
+        """
+        .json: {"v": [...], "w": [...]} or a list of [v, w] pairs.
+        A directory is read as a session recorded by client_base --record (see utils.trace).
+        Anything else is read as text with two columns v, w (comma or whitespace separated).
+        """
+        if os.path.isdir(file_name):
+            from utils.trace import TraceReader
+            reader = TraceReader(file_name)
+            return cls(reader["user_v"] * reader.meter_per_px, reader["user_w"])
+        if file_name.endswith(".json"):
+            with open(file_name) as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return cls(data["v"], data["w"])
+            data = np.asarray(data, dtype=float).reshape(-1, 2)
+        else:
+            with open(file_name) as f:
+                data = np.loadtxt(f, delimiter="," if file_name.endswith(".csv") else None, ndmin=2)
+        return cls(data[:, 0], data[:, 1])
+
+    def frames(self, delta_t):
+        # the recording fixes the frame length, delta_t is not used
+        for v, w in zip(self.v.tolist(), self.w.tolist()):
+            yield v, w
+
+PATH_KINDS = ("random", "waypoints", "trace")
+
+def make_path(kind, file_name, seed):
+    """
+    The path a --path/--path-file command line option names: a RandomWalk(seed), or the
+    WaypointPath / RecordedTrace read from file_name.
+    """
+    if kind == "random":
+        return RandomWalk(seed)
+    if kind not in PATH_KINDS:
+        raise ValueError(f"unknown path kind {kind!r}, expected one of {PATH_KINDS}")
+    if file_name is None:
+        raise ValueError(f"a {kind} path needs a file")
+    if kind == "waypoints":
+        return WaypointPath.from_file(file_name)
+    return RecordedTrace.from_file(file_name)
@@ -0,0 +1,100 @@
+"""
+Profiling hooks for controllers.
+
+StageTimers keeps one LatencyHistogram per named stage (a controller entry point, a
+step of VisPolyRdw.update, ...) with its cumulative time and percentiles. Recording
+costs two clock reads per call, so sessions always keep one.
+
+ProfileCapture runs the next N frames of a session under cProfile and writes the
+pstats dump locally when the last one is done, so that a live session can be
+profiled without restarting the server:
+
+    python -m pstats profiles/session1-1700000000-1.prof
+"""
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import time
+from utils.latency import LatencyHistogram
+
+PROFILE_DIR = "profiles"
+
+class StageTimers:
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, name, seconds):
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = self.stages[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def call(self, name, fn, *args):
+        # fn(*args), timed as stage name
+        t = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.record(name, time.perf_counter() - t)
+
+    def as_dict(self):
+        # times in ms, the stage with the largest cumulative time first
+        ordered = sorted(self.stages.items(), key=lambda item: item[1].total, reverse=True)
+        return {name: dict(h.as_dict(), total_ms=h.total * 1000) for name, h in ordered}
+
+    def summary(self):
+        return format_stages(self.as_dict())
+
+def format_stages(stages):
+    # one console line from StageTimers.as_dict(), which may come from another process
+    return ", ".join(f"{name} {s['total_ms']:.1f} ms total p50 {s['p50']:.3f} ms p99 {s['p99']:.3f} ms"
+                     for name, s in stages.items())
+
+class ProfileCapture:
+    """
+    cProfile of the next `frames` calls of run(); dump() writes them to path in pstats format.
+    """
+    def __init__(self, frames, path):
+        self.remaining = frames
+        self.frames = 0
+        self.path = path
+        self.profile = cProfile.Profile()
+
+    @property
+    def done(self):
+        return self.remaining <= 0
+
+    def run(self, fn, *args):
+        # the profiler only sees the calling thread, so it is enabled around the call itself
+        self.remaining -= 1
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler per process at a time, e.g. the capture of another session
+            return fn(*args)
+        self.frames += 1
+        try:
+            return fn(*args)
+        finally:
+            self.profile.disable()
+
+    def dump(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.profile.dump_stats(self.path)
+        return self.path
+
+    def top(self, count = 15, sort = "cumulative"):
+        # the most expensive functions, as pstats prints them
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats(sort).print_stats(count)
+        return out.getvalue()
+
+_captures = itertools.count(1)
+
+def profile_path(directory, name):
+    # a new file for every capture, also for several captures in the same second
+    return os.path.join(directory, f"{name}-{int(time.time())}-{next(_captures)}.prof")
@@ -0,0 +1,69 @@
+import json
+import math
+import numpy as np
+from utils.constants import *
+from utils.space import Space
+
+def load_room(file_name):
+    """
+    Load a physical room saved as JSON. Both the whole start message
+    ({"type": "start", "physical": {...}}) and its "physical" part
+    ({"border": [...], "obstacle_list": [...]}) are accepted.
+    Coordinates are in the front end's pixel units, see METER_PER_PX.
+    """
+    with open(file_name) as f:
+        data = json.load(f)
+    if "physical" in data:
+        data = data["physical"]
+    return {"border": data["border"], "obstacle_list": data.get("obstacle_list", [])}
+
+def rectangle_room(width, height, meter_per_px = METER_PER_PX):
+    """
+    A width x height (m) room without obstacles, in the same layout as load_room.
+    """
+    w = width / meter_per_px
+    h = height / meter_per_px
+    return {"border": [{"x": 0, "y": 0}, {"x": w, "y": 0}, {"x": w, "y": h}, {"x": 0, "y": h}], "obstacle_list": []}
+
+def room_space(room, meter_per_px = METER_PER_PX):
+    return Space(room["border"], room["obstacle_list"], meter_per_px)
+
+def synthetic_room(n_segments, seed = 0, radius = 10.0):
+    """
+    A reproducible room with about n_segments segments, in meters (use meter_per_px = 1).
+    The border is a star-shaped polygon around (radius, radius); roughly half of the segments
+    belong to disjoint square obstacles placed on a jittered grid, keeping the center free.
+    """
+    rng = np.random.default_rng(seed)
+    n_obstacles = (n_segments // 2) // 4
+    if n_segments - 4 * n_obstacles < 8:
+        n_obstacles = max(0, (n_segments - 8) // 4)
+    n_border = max(3, n_segments - 4 * n_obstacles)
+
+    c = radius
+    step = 2 * math.pi / n_border
+    angles = np.arange(n_border) * step + rng.uniform(-0.3, 0.3, n_border) * step
+    radii = rng.uniform(0.8, 1.0, n_border) * radius
+    border = [{"x": c + r * math.cos(a), "y": c + r * math.sin(a)} for a, r in zip(angles, radii)]
+
+    obstacle_list = []
+    if n_obstacles > 0:
+        # grid cells inside the ring 0.15 R .. 0.6 R, enough of them for every obstacle
+        cells = int(math.ceil(math.sqrt(n_obstacles * 2.5))) + 2
+        while True:
+            size = 1.2 * radius / cells
+            centers = [(c - 0.6 * radius + (i + 0.5) * size, c - 0.6 * radius + (j + 0.5) * size)
+                       for i in range(cells) for j in range(cells)]
+            centers = [(x, y) for x, y in centers if 0.15 * radius + size <= math.hypot(x - c, y - c) <= 0.6 * radius - size / 2]
+            if len(centers) >= n_obstacles:
+                break
+            cells += 1
+        chosen = rng.choice(len(centers), n_obstacles, replace=False)
+        for k in chosen:
+            x, y = centers[k]
+            half = size * rng.uniform(0.15, 0.35)
+            x += rng.uniform(-0.1, 0.1) * size
+            y += rng.uniform(-0.1, 0.1) * size
+            obstacle_list.append([{"x": x - half, "y": y - half}, {"x": x + half, "y": y - half},
+                                  {"x": x + half, "y": y + half}, {"x": x - half, "y": y + half}])
+    return {"border": border, "obstacle_list": obstacle_list}
@@ -0,0 +1,137 @@
+"""
+Signed distance field of a Space: the distance (m) from a point to the nearest wall or
+obstacle, positive in free space and negative inside obstacles or outside the border.
+It is sampled once on a regular grid, together with its gradient, which points away
+from the nearest wall (towards free space). Queries interpolate bilinearly between the
+four grid nodes around the point, in constant time whatever the room.
+
+The distance is 1-Lipschitz, so an interpolated value is within resolution * sqrt(2)
+of the exact one. in_obstacle trusts the sign of the field beyond that margin and asks
+the exact geometry of the Space near boundaries and outside the grid.
+"""
+import math
+import numpy as np
+import shapely
+from shapely.geometry.polygon import Polygon
+
+SDF_RESOLUTION = 0.05 # m
+# grid nodes added around the border, so that points slightly outside it still interpolate
+PADDING = 2
+# refuse grids larger than this, usually a room in px rather than m
+MAX_NODES = 16_000_000
+
+class SignedDistanceField:
+    def __init__(self, space, resolution = SDF_RESOLUTION):
+        """
+        Sample the field of space (a utils.space.Space) on a grid of the given resolution (m).
+        """
+        self.space = space
+        self.resolution = resolution
+        xs = [p[0] for p in space.border]
+        ys = [p[1] for p in space.border]
+        self.x0 = float(min(xs) - PADDING * resolution)
+        self.y0 = float(min(ys) - PADDING * resolution)
+        self.nx = int(math.ceil((max(xs) - min(xs)) / resolution)) + 2 * PADDING + 1
+        self.ny = int(math.ceil((max(ys) - min(ys)) / resolution)) + 2 * PADDING + 1
+        if self.nx * self.ny > MAX_NODES:
+            raise ValueError(f"a {self.nx} x {self.ny} distance field is too large, use a coarser resolution than {resolution}")
+        self.margin = float(resolution * math.sqrt(2) + 1e-9)
+
+        gx, gy = np.meshgrid(self.x0 + np.arange(self.nx) * resolution, self.y0 + np.arange(self.ny) * resolution)
+        # walls are the boundary of the free region, which also handles overlapping obstacles
+        free = Polygon(space.border)
+        if space.obstacle_list:
+            free = free.difference(shapely.union_all([Polygon(obstacle) for obstacle in space.obstacle_list]))
+        dist = shapely.distance(free.boundary, shapely.points(gx.ravel(), gy.ravel())).reshape(gx.shape)
+        blocked = space.in_obstacle_exact_many(gx, gy)
+        # rows are y, columns are x
+        self.distance_grid = np.where(blocked, -dist, dist)
+        self.gradient_y, self.gradient_x = np.gradient(self.distance_grid, resolution)
+
+    def _cell(self, x, y):
+        # grid cell (i, j) of (x, y), the position (tx, ty) inside it, and whether the point is on the grid;
+        # points outside the grid take the value of its nearest edge
+        fx = (x - self.x0) / self.resolution
+        fy = (y - self.y0) / self.resolution
+        i = int(math.floor(fx))
+        j = int(math.floor(fy))
+        inside = 0 <= i < self.nx - 1 and 0 <= j < self.ny - 1
+        i = min(max(i, 0), self.nx - 2)
+        j = min(max(j, 0), self.ny - 2)
+        return i, j, min(max(fx - i, 0.0), 1.0), min(max(fy - j, 0.0), 1.0), inside
+
+    def _cells(self, xs, ys):
+        fx = (np.asarray(xs, dtype=float) - self.x0) / self.resolution
+        fy = (np.asarray(ys, dtype=float) - self.y0) / self.resolution
+        i = np.floor(fx)
+        j = np.floor(fy)
+        inside = (i >= 0) & (j >= 0) & (i < self.nx - 1) & (j < self.ny - 1)
+        i = np.clip(i, 0, self.nx - 2).astype(np.intp)
+        j = np.clip(j, 0, self.ny - 2).astype(np.intp)
+        tx = np.clip(fx - i, 0.0, 1.0)
+        ty = np.clip(fy - j, 0.0, 1.0)
+        return i, j, tx, ty, inside
+
+    @staticmethod
+    def _interp(grid, i, j, tx, ty):
+        return ((grid[j, i] * (1 - tx) + grid[j, i + 1] * tx) * (1 - ty)
+                + (grid[j + 1, i] * (1 - tx) + grid[j + 1, i + 1] * tx) * ty)
+
+    @staticmethod
+    def _interp_at(grid, i, j, tx, ty):
+        # _interp for one point, on Python floats
+        item = grid.item
+        return ((item(j, i) * (1 - tx) + item(j, i + 1) * tx) * (1 - ty)
+                + (item(j + 1, i) * (1 - tx) + item(j + 1, i + 1) * tx) * ty)
+
+    def distance(self, x, y):
+        """
+        Interpolated signed distance at (x, y), m.
+        """
+        i, j, tx, ty, _ = self._cell(x, y)
+        return self._interp_at(self.distance_grid, i, j, tx, ty)
+
+    def gradient(self, x, y):
+        """
+        Interpolated gradient (gx, gy) of the distance at (x, y): about unit length, pointing away from the nearest wall.
+        """
+        i, j, tx, ty, _ = self._cell(x, y)
+        return self._interp_at(self.gradient_x, i, j, tx, ty), self._interp_at(self.gradient_y, i, j, tx, ty)
+
+    def distance_many(self, xs, ys):
+        """
+        Batched distance. xs, ys: array-likes of the same shape.
+        """
+        i, j, tx, ty, _ = self._cells(xs, ys)
+        return self._interp(self.distance_grid, i, j, tx, ty)
+
+    def gradient_many(self, xs, ys):
+        i, j, tx, ty, _ = self._cells(xs, ys)
+        return self._interp(self.gradient_x, i, j, tx, ty), self._interp(self.gradient_y, i, j, tx, ty)
+
+    def in_obstacle(self, x, y):
+        i, j, tx, ty, inside = self._cell(x, y)
+        if inside:
+            d = self._interp_at(self.distance_grid, i, j, tx, ty)
+            if d > self.margin:
+                return False
+            if d < -self.margin:
+                return True
+        return self.space.in_obstacle_exact(x, y)
+
+    def in_obstacle_many(self, xs, ys):
+        """
+        Batched in_obstacle, exact: only the points close to a boundary go to the geometry of the Space.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        shape = np.broadcast_shapes(xs.shape, ys.shape)
+        xs = np.broadcast_to(xs, shape).ravel()
+        ys = np.broadcast_to(ys, shape).ravel()
+        i, j, tx, ty, inside = self._cells(xs, ys)
+        d = self._interp(self.distance_grid, i, j, tx, ty)
+        result = d < 0
+        unsure = np.flatnonzero(~inside | (np.abs(d) <= self.margin))
+        if len(unsure) > 0:
+            result[unsure] = self.space.in_obstacle_exact_many(xs[unsure], ys[unsure])
+        return result.reshape(shape)
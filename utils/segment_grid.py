@@ -0,0 +1,265 @@
+"""
+Uniform grid over the wall segments of a room (border and obstacles), for ray queries
+whose cost depends on the cells a ray crosses rather than on the number of segments.
+
+Every cell lists the segments that touch it (CSR layout: the segments of cell c are
+cell_segments[offsets[c]:offsets[c + 1]]). A ray walks the cells it crosses in order
+(Amanatides & Woo) and stops at the first cell that contains a hit closer than the
+cell exit. raycast follows one ray in plain Python; raycast_many follows many rays in
+lockstep with NumPy.
+
+On top of it, time-to-collision queries for predictive resets: time_to_collision along
+the current heading, and frames_to_collision along the per-frame chords that
+calc_move_with_gain produces for candidate gains.
+"""
+import math
+import numpy as np
+
+EPS = 1e-9
+# frames looked ahead by frames_to_collision
+HORIZON = 100
+
+def _segments(border, obstacles):
+    # (M, 4) array of x1, y1, x2, y2 over the closed border and obstacle polygons
+    rows = []
+    for poly in [border] + list(obstacles):
+        n = len(poly)
+        for k in range(n):
+            (x1, y1), (x2, y2) = poly[k], poly[(k + 1) % n]
+            rows.append((x1, y1, x2, y2))
+    return np.asarray(rows, dtype=float).reshape(-1, 4)
+
+class SegmentGrid:
+    def __init__(self, border, obstacles = (), cell_size = None):
+        """
+        border: [(x, y), ...], obstacles: list of such polygons, in m.
+        cell_size: side of a grid cell in m, by default about one segment per cell.
+        """
+        self.segments = _segments(border, obstacles)
+        xs = [p[0] for p in border]
+        ys = [p[1] for p in border]
+        width = max(xs) - min(xs)
+        height = max(ys) - min(ys)
+        if cell_size is None:
+            cell_size = max(math.sqrt(width * height / max(1, len(self.segments))), max(width, height) / 512)
+        self.cell_size = float(cell_size)
+        self.x0 = float(min(xs))
+        self.y0 = float(min(ys))
+        self.nx = max(1, int(math.ceil(width / self.cell_size)))
+        self.ny = max(1, int(math.ceil(height / self.cell_size)))
+        self._build()
+
+    def _build(self):
+        c = self.cell_size
+        cells = []
+        owners = []
+        for k, (x1, y1, x2, y2) in enumerate(self.segments.tolist()):
+            # cells of the bounding box, kept when the segment line passes through the cell
+            i0, i1 = self._clamp_i(min(x1, x2)), self._clamp_i(max(x1, x2))
+            j0, j1 = self._clamp_j(min(y1, y2)), self._clamp_j(max(y1, y2))
+            gi, gj = np.meshgrid(np.arange(i0, i1 + 1), np.arange(j0, j1 + 1))
+            gi = gi.ravel()
+            gj = gj.ravel()
+            cx = self.x0 + (gi + 0.5) * c
+            cy = self.y0 + (gj + 0.5) * c
+            nx, ny = y2 - y1, x1 - x2
+            touch = np.abs(nx * (cx - x1) + ny * (cy - y1)) <= (abs(nx) + abs(ny)) * c * 0.5 + EPS
+            cells.append(gj[touch] * self.nx + gi[touch])
+            owners.append(np.full(int(touch.sum()), k))
+        cells = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+        owners = np.concatenate(owners) if owners else np.empty(0, dtype=np.int64)
+        order = np.argsort(cells, kind="stable")
+        self.cell_segments = owners[order].astype(np.intp)
+        self.offsets = np.zeros(self.nx * self.ny + 1, dtype=np.intp)
+        np.cumsum(np.bincount(cells, minlength=self.nx * self.ny), out=self.offsets[1:])
+        # per-cell lists for the scalar path
+        segs = self.cell_segments.tolist()
+        bounds = self.offsets.tolist()
+        self._cell_lists = [segs[bounds[k]:bounds[k + 1]] for k in range(self.nx * self.ny)]
+        self._segment_rows = self.segments.tolist()
+
+    def _clamp_i(self, x):
+        return min(max(int(math.floor((x - self.x0) / self.cell_size)), 0), self.nx - 1)
+
+    def _clamp_j(self, y):
+        return min(max(int(math.floor((y - self.y0) / self.cell_size)), 0), self.ny - 1)
+
+    def _enter(self, x, y, dx, dy):
+        # [t_in, t_out] of the ray inside the grid box, or None when it misses the box
+        t_in, t_out = 0.0, math.inf
+        for o, d, lo, hi in ((x, dx, self.x0, self.x0 + self.nx * self.cell_size),
+                             (y, dy, self.y0, self.y0 + self.ny * self.cell_size)):
+            if d == 0:
+                if o < lo or o > hi:
+                    return None
+                continue
+            ta, tb = (lo - o) / d, (hi - o) / d
+            t_in = max(t_in, min(ta, tb))
+            t_out = min(t_out, max(ta, tb))
+        if t_in > t_out:
+            return None
+        return t_in, t_out
+
+    def raycast(self, x, y, angle, max_dist = math.inf):
+        """
+        Distance from (x, y) to the first wall along angle, or inf when there is none within max_dist.
+        """
+        dx = math.cos(angle)
+        dy = math.sin(angle)
+        span = self._enter(x, y, dx, dy)
+        if span is None:
+            return math.inf
+        t_in, t_out = span
+        limit = min(max_dist, t_out)
+        c = self.cell_size
+        i = self._clamp_i(x + dx * t_in)
+        j = self._clamp_j(y + dy * t_in)
+        step_i = 1 if dx > 0 else -1
+        step_j = 1 if dy > 0 else -1
+        t_max_x = (self.x0 + (i + (dx > 0)) * c - x) / dx if dx != 0 else math.inf
+        t_max_y = (self.y0 + (j + (dy > 0)) * c - y) / dy if dy != 0 else math.inf
+        t_delta_x = c / abs(dx) if dx != 0 else math.inf
+        t_delta_y = c / abs(dy) if dy != 0 else math.inf
+        rows = self._segment_rows
+        best = math.inf
+        while True:
+            for s in self._cell_lists[j * self.nx + i]:
+                x1, y1, x2, y2 = rows[s]
+                vx = x2 - x1
+                vy = y2 - y1
+                denom = dx * vy - dy * vx
+                if abs(denom) < EPS:
+                    continue
+                wx = x1 - x
+                wy = y1 - y
+                t = (wx * vy - wy * vx) / denom
+                u = (wx * dy - wy * dx) / denom
+                if 0 <= t < best and 0.0 <= u <= 1.0:
+                    best = t
+            t_exit = min(t_max_x, t_max_y)
+            if best <= t_exit or t_exit > limit:
+                break
+            if t_max_x < t_max_y:
+                i += step_i
+                t_max_x += t_delta_x
+                if i < 0 or i >= self.nx:
+                    break
+            else:
+                j += step_j
+                t_max_y += t_delta_y
+                if j < 0 or j >= self.ny:
+                    break
+        return best if best <= max_dist else math.inf
+
+    def raycast_many(self, xs, ys, angles, max_dist = math.inf):
+        """
+        Batched raycast. xs, ys, angles, max_dist: arrays (or scalars) broadcast to one shape.
+        Return an array of distances of that shape, inf where nothing is hit within max_dist.
+        """
+        xs, ys, angles, max_dist = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (xs, ys, angles, max_dist)])
+        shape = xs.shape
+        x = xs.ravel()
+        y = ys.ravel()
+        dx = np.cos(angles.ravel())
+        dy = np.sin(angles.ravel())
+        max_dist = max_dist.ravel()
+        c = self.cell_size
+        best = np.full(len(x), np.inf)
+
+        # clip every ray to the grid box
+        t_in = np.zeros(len(x))
+        t_out = np.full(len(x), np.inf)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for o, d, lo, hi in ((x, dx, self.x0, self.x0 + self.nx * c), (y, dy, self.y0, self.y0 + self.ny * c)):
+                ta = (lo - o) / d
+                tb = (hi - o) / d
+                parallel = d == 0
+                outside = parallel & ((o < lo) | (o > hi))
+                t_in = np.maximum(t_in, np.where(parallel, -np.inf, np.minimum(ta, tb)))
+                t_out = np.minimum(t_out, np.where(parallel, np.where(outside, -np.inf, np.inf), np.maximum(ta, tb)))
+            limit = np.minimum(max_dist, t_out)
+            i = np.clip(np.floor((x + dx * t_in - self.x0) / c), 0, self.nx - 1).astype(np.intp)
+            j = np.clip(np.floor((y + dy * t_in - self.y0) / c), 0, self.ny - 1).astype(np.intp)
+            step_i = np.where(dx > 0, 1, -1)
+            step_j = np.where(dy > 0, 1, -1)
+            t_max_x = np.where(dx != 0, (self.x0 + (i + (dx > 0)) * c - x) / dx, np.inf)
+            t_max_y = np.where(dy != 0, (self.y0 + (j + (dy > 0)) * c - y) / dy, np.inf)
+            t_delta_x = np.where(dx != 0, c / np.abs(dx), np.inf)
+            t_delta_y = np.where(dy != 0, c / np.abs(dy), np.inf)
+
+        active = np.flatnonzero(t_in <= t_out)
+        seg = self.segments
+        while len(active) > 0:
+            # segments of the current cell of every active ray
+            cell = j[active] * self.nx + i[active]
+            lo = self.offsets[cell]
+            counts = self.offsets[cell + 1] - lo
+            total = int(counts.sum())
+            if total > 0:
+                ray = np.repeat(active, counts)
+                starts = np.cumsum(counts) - counts
+                s = self.cell_segments[np.repeat(lo - starts, counts) + np.arange(total)]
+                vx = seg[s, 2] - seg[s, 0]
+                vy = seg[s, 3] - seg[s, 1]
+                rdx = dx[ray]
+                rdy = dy[ray]
+                denom = rdx * vy - rdy * vx
+                ok = np.abs(denom) >= EPS
+                denom = np.where(ok, denom, 1.0)
+                wx = seg[s, 0] - x[ray]
+                wy = seg[s, 1] - y[ray]
+                t = (wx * vy - wy * vx) / denom
+                u = (wx * rdy - wy * rdx) / denom
+                hit = ok & (t >= 0) & (u >= 0.0) & (u <= 1.0)
+                np.minimum.at(best, ray[hit], t[hit])
+
+            t_exit = np.minimum(t_max_x[active], t_max_y[active])
+            done = (best[active] <= t_exit) | (t_exit > limit[active])
+            go_x = t_max_x[active] < t_max_y[active]
+            ax = active[go_x & ~done]
+            ay = active[~go_x & ~done]
+            i[ax] += step_i[ax]
+            t_max_x[ax] += t_delta_x[ax]
+            j[ay] += step_j[ay]
+            t_max_y[ay] += t_delta_y[ay]
+            done |= (i[active] < 0) | (i[active] >= self.nx) | (j[active] < 0) | (j[active] >= self.ny)
+            active = active[~done]
+
+        return np.where(best <= max_dist, best, np.inf).reshape(shape)
+
+    def time_to_collision(self, xs, ys, angles, speeds):
+        """
+        Time before walking straight along angle at the given speed (e.g. user.v, m/frame, giving frames)
+        hits a wall, inf when it never does. Scalars or arrays.
+        """
+        dist = self.raycast_many(xs, ys, angles)
+        speeds = np.abs(np.asarray(speeds, dtype=float))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(speeds > 0, dist / speeds, np.inf)
+
+    def frames_to_collision(self, user, trans_gain, rot_gain, cur_gain_r, cur_direction, horizon = HORIZON):
+        """
+        Frames until the user (a UserInfo, keeping its v and w) steps into a wall when calc_move_with_gain
+        applies the given gains every frame, for one or several candidates (scalars or arrays of K gains).
+        Return an array of K values: 1 when the next step already collides, inf when no step within horizon does.
+        """
+        trans_gain, rot_gain, cur_gain_r, cur_direction = np.broadcast_arrays(
+            *[np.atleast_1d(np.asarray(g, dtype=float)) for g in (trans_gain, rot_gain, cur_gain_r, cur_direction)])
+        d_s = user.v / trans_gain
+        turn = user.w / rot_gain
+        with np.errstate(divide='ignore', invalid='ignore'):
+            turn = turn + np.where(cur_gain_r != 0, cur_direction * d_s / cur_gain_r, 0.0)
+        # heading of frame f is angle + f * turn; the step of frame f is a chord of length d_s along it
+        frames = np.arange(1, horizon + 1)
+        dirs = user.angle + turn[:, None] * frames[None, :]
+        step_x = np.cumsum(d_s[:, None] * np.cos(dirs), axis=1)
+        step_y = np.cumsum(d_s[:, None] * np.sin(dirs), axis=1)
+        x0 = user.x + np.concatenate([np.zeros((len(d_s), 1)), step_x[:, :-1]], axis=1)
+        y0 = user.y + np.concatenate([np.zeros((len(d_s), 1)), step_y[:, :-1]], axis=1)
+        # walking backwards casts the chord the other way
+        backwards = (d_s < 0)[:, None]
+        length = np.broadcast_to(np.abs(d_s)[:, None], dirs.shape)
+        hit = self.raycast_many(x0, y0, np.where(backwards, dirs + math.pi, dirs), length) < np.inf
+        hit &= length > 0
+        first = np.argmax(hit, axis=1)
+        return np.where(hit.any(axis=1), first + 1.0, np.inf)
@@ -0,0 +1,283 @@
+"""
+Controller state of a websocket session, and where its calls run.
+
+The controller file is compiled once per process (utils.controller.ControllerSource)
+and warmed up on a throwaway session at server start. A Session owns one instance
+of the controller module and the Space of the current start message, so sessions
+never share controller state. A SessionPool decides where the CPU-heavy calls run:
+
+    inline   on the event loop, one session at a time (the historical behaviour)
+    thread   in a shared ThreadPoolExecutor
+    process  in worker processes; every session is pinned to one worker, which
+             keeps its Session between calls
+
+Calls of one session are awaited one after another by its connection handler,
+so replies always come back in frame order. When the controller file changes,
+SessionPool.reload() recompiles it and every session switches to the new code
+before its next frame, keeping its connection and its room.
+
+Every Session times its controller entry points (utils.profiling.StageTimers), and
+profile() runs its next frames under cProfile, in whichever thread or process
+the session lives.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from utils.constants import *
+from utils.space import Space, UserInfo
+from utils.controller import Controller, ControllerSource
+from utils.profiling import StageTimers, ProfileCapture
+from utils.rooms import rectangle_room
+from utils.simulation import free_start
+
+WARMUP_FRAMES = 20
+
+class Session:
+    def __init__(self, source, universal = False, meter_per_px = METER_PER_PX):
+        # one module instance per session, so the controller functions share its state
+        self.source = source
+        self.version = source.version
+        self.controller = Controller(source.instantiate(), universal)
+        self.universal = universal
+        self.meter_per_px = meter_per_px
+        # the Space of the start message, kept to prepare it again after a reload
+        self.space = None
+        self.physical_space = None
+        self.timers = StageTimers()
+        # cProfile capture of the next frames, see profile()
+        self.capture = None
+        # last version of the source that failed to load, see refresh()
+        self.failed_version = None
+
+    def start(self, physical):
+        self.space = Space(physical["border"], physical["obstacle_list"], self.meter_per_px)
+        self.timers = StageTimers()
+        self.prepare()
+
+    def prepare(self):
+        self.physical_space = self.prepared(self.controller)
+
+    def prepared(self, controller):
+        if controller.prepare_space is None:
+            return self.space
+        # per-session precomputation, the controller gets its result instead of the Space
+        physical_space = self.timers.call("prepare_space", controller.prepare_space, self.space)
+        # visibility controllers (CompiledSpace) time their own stages in the same table
+        vis = getattr(physical_space, "vis", None)
+        if hasattr(vis, "timers"):
+            vis.timers = self.timers
+        return physical_space
+
+    def refresh(self):
+        # switch to the current code of the source, between two frames. The new code replaces the
+        # running one only once it loaded, has its entry points and prepared the current room;
+        # otherwise the session keeps going with the previous controller and retries next frame.
+        version = self.source.version
+        if self.version == version:
+            return
+        try:
+            controller = Controller(self.source.instantiate(), self.universal)
+            missing = controller.missing()
+            if missing:
+                raise AttributeError(f"controller {self.source.file_name} does not define {', '.join(missing)}")
+            physical_space = self.prepared(controller) if self.space is not None else None
+        except Exception:
+            if self.failed_version != version:
+                # reported once per version of the file
+                self.failed_version = version
+                traceback.print_exc()
+                print("keeping the previous controller")
+            return
+        self.controller = controller
+        self.physical_space = physical_space
+        self.version = version
+
+    def profile(self, frames, path):
+        """
+        Run the next `frames` running frames under cProfile and dump them to path. A capture still in
+        progress is dumped first; frames = 0 only stops it. Return the path of the dump written now, if any.
+        """
+        written = self.finish_capture() if self.capture is not None else None
+        if frames > 0:
+            self.capture = ProfileCapture(frames, path)
+        return written
+
+    def finish_capture(self):
+        capture = self.capture
+        self.capture = None
+        path = capture.dump()
+        print(f"profile of {capture.frames} frames written to {path}")
+        print(capture.top())
+        return path
+
+    def stage_stats(self):
+        return self.timers.as_dict()
+
+    def running(self, data):
+        """
+        Reply dict to a running message, and the seconds spent computing it.
+        """
+        t_compute = time.perf_counter()
+        if self.capture is None:
+            reply = self.reply(data)
+        else:
+            reply = self.capture.run(self.reply, data)
+            if self.capture.done:
+                self.finish_capture()
+        return reply, time.perf_counter() - t_compute
+
+    def reply(self, data):
+        self.refresh()
+        controller = self.controller
+        physical_space = self.physical_space
+        meter_per_px = self.meter_per_px
+        user = UserInfo(data["physical"]["user_x"], data["physical"]["user_y"], data["physical"]["user_direction"], data["user_v"], data["user_w"], meter_per_px)
+        delta_t = data["delta_t"]
+        need_reset = data["need_reset"]
+        timers = self.timers
+        if need_reset:
+            user = timers.call("update_reset", controller.update_reset, user, physical_space, delta_t)
+            reply = {"type": "running", "user_x": user.x / meter_per_px, "user_y": user.y / meter_per_px, "user_direction": user.angle, "reset": True}
+        else:
+            has_reset=False
+            if self.universal:
+                user, has_reset = timers.call("update_user", controller.update_user, user, physical_space, delta_t)
+                reply = {"type": "running", "user_x": user.x / meter_per_px, "user_y": user.y / meter_per_px, "user_direction": user.angle, "reset": has_reset}
+            else:
+                trans_gain, rot_gain, cur_gain_r, cur_direction = timers.call("calc_gain", controller.calc_gain, user, physical_space, delta_t)
+                reply = {"type": "running-gain", "trans_gain": trans_gain, "rot_gain": rot_gain, "cur_gain": cur_gain_r*(cur_direction)/abs(cur_direction), "reset": has_reset}
+        return reply
+
+def warm_up(source, universal = False, meter_per_px = METER_PER_PX, room = None, frames = WARMUP_FRAMES):
+    """
+    Run a throwaway session on room (default an empty 6 x 6 m room), so that imports, first calls and
+    lazily built caches are paid at server start instead of by the first client. Return the seconds spent.
+    """
+    t = time.perf_counter()
+    session = Session(source, universal, meter_per_px)
+    session.start(room if room is not None else rectangle_room(6, 6, meter_per_px))
+    x, y = free_start(session.space)
+    for i in range(frames):
+        session.running({
+            "physical": {"user_x": x / meter_per_px, "user_y": y / meter_per_px, "user_direction": 0.0},
+            "user_v": 0.02 / meter_per_px,
+            "user_w": 0.01,
+            "delta_t": DELTA_T,
+            "need_reset": i == frames - 1,
+        })
+    return time.perf_counter() - t
+
+# controller source and sessions living in this worker process (process mode)
+_worker_source = None
+_worker_sessions = {}
+
+def _worker_init(file_name, universal, meter_per_px, room):
+    global _worker_source
+    _worker_source = ControllerSource(file_name)
+    warm_up(_worker_source, universal, meter_per_px, room)
+
+def _worker_open(key, universal, meter_per_px):
+    _worker_sessions[key] = Session(_worker_source, universal, meter_per_px)
+
+def _worker_call(key, method, args):
+    return getattr(_worker_sessions[key], method)(*args)
+
+def _worker_close(key):
+    _worker_sessions.pop(key, None)
+
+def _worker_reload():
+    return _worker_source.reload()
+
+class _ProcessHandle:
+    def __init__(self, key, executor):
+        self.key = key
+        self.executor = executor
+
+class SessionPool:
+    """
+    Sessions of the controller in file_name. mode: "inline", "thread" or "process"; workers: size of the
+    thread pool or number of worker processes (default: number of CPU cores). The controller is compiled
+    and warmed up on warmup_room (a room as returned by utils.rooms.load_room) when the pool is created,
+    once per worker process in process mode.
+    """
+    MODES = ("inline", "thread", "process")
+
+    def __init__(self, file_name, universal = False, meter_per_px = METER_PER_PX, mode = "inline", workers = None, warmup_room = None):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown session pool mode {mode!r}, expected one of {self.MODES}")
+        self.mode = mode
+        self.universal = universal
+        self.meter_per_px = meter_per_px
+        self.workers = workers or os.cpu_count()
+        self.source = ControllerSource(file_name)
+        self._threads = None
+        self._processes = []
+        self._next = 0
+        if mode == "process":
+            # single-process executors, so a session can be pinned to the worker holding its state;
+            # spawned rather than forked, so the workers do not inherit the listening socket of the server
+            context = multiprocessing.get_context("spawn")
+            self._processes = [ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_worker_init,
+                                                   initargs=(file_name, universal, meter_per_px, warmup_room))
+                               for _ in range(self.workers)]
+            # start and warm up every worker now rather than on the first session
+            for future in [executor.submit(os.getpid) for executor in self._processes]:
+                future.result()
+            self.warmup_time = None
+        else:
+            if mode == "thread":
+                self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="session")
+            self.warmup_time = warm_up(self.source, universal, meter_per_px, warmup_room)
+
+    async def open(self, key):
+        if self.mode == "inline":
+            return Session(self.source, self.universal, self.meter_per_px)
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            return await loop.run_in_executor(self._threads, Session, self.source, self.universal, self.meter_per_px)
+        executor = self._processes[self._next % len(self._processes)]
+        self._next += 1
+        await loop.run_in_executor(executor, _worker_open, key, self.universal, self.meter_per_px)
+        return _ProcessHandle(key, executor)
+
+    async def call(self, handle, method, *args):
+        if self.mode == "inline":
+            return getattr(handle, method)(*args)
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            return await loop.run_in_executor(self._threads, getattr(handle, method), *args)
+        return await loop.run_in_executor(handle.executor, _worker_call, handle.key, method, args)
+
+    async def close(self, handle):
+        if self.mode == "process":
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(handle.executor, _worker_close, handle.key)
+
+    async def reload(self):
+        """
+        Recompile the controller if its file changed; sessions pick the new code up before their next frame.
+        Return True when it was reloaded.
+        """
+        if not self.source.reload():
+            return False
+        if self.mode == "process":
+            # every worker compiles its own copy; a worker runs one call at a time, so this lands between frames
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(executor, _worker_reload) for executor in self._processes])
+        return True
+
+    async def watch(self, interval = 1.0):
+        # poll the controller file and reload it when it changes, until cancelled
+        while True:
+            await asyncio.sleep(interval)
+            if await self.reload():
+                print(f"reloaded controller {self.source.file_name} (version {self.source.version})")
+
+    def shutdown(self):
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+        for executor in self._processes:
+            executor.shutdown(wait=True, cancel_futures=True)
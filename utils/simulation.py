@@ -0,0 +1,246 @@
+"""
+Headless simulation: drive a controller with a virtual user path, without the web front end.
+
+Each frame follows the protocol handled by client_base.user_loop. In gain mode the
+gains returned by calc_gain are applied with calc_move_with_gain; in universal mode
+update_user moves the user itself. When the new position lies in an obstacle the
+user stays at the pose before the collision and the next frame is a reset frame,
+which calls update_reset with that pose, as the front end does with need_reset.
+The loop runs as fast as the controller allows.
+
+simulate_crowd moves many independent users through the same physical space with
+calc_move_with_gain_batch, one vectorized step per frame for all of them.
+"""
+import math
+import time
+import numpy as np
+from itertools import islice
+from utils.constants import *
+from utils.space import UserInfo, UserBatch
+from utils.misc import calc_move_with_gain, calc_move_with_gain_batch
+
+class SimulationResult:
+    """
+    frames: simulated frames, resets: number of resets, virtual_distance: m walked in the virtual space,
+    physical_distance: m walked in the physical space (reset moves excluded),
+    compute_times: seconds spent in the controller for every frame, wall_time: seconds for the whole run.
+    """
+    def __init__(self, frames, resets, virtual_distance, physical_distance, compute_times, wall_time):
+        self.frames = frames
+        self.resets = resets
+        self.virtual_distance = virtual_distance
+        self.physical_distance = physical_distance
+        self.compute_times = np.asarray(compute_times, dtype=float)
+        self.wall_time = wall_time
+
+    @property
+    def resets_per_meter(self):
+        return self.resets / self.virtual_distance if self.virtual_distance > 0 else 0.0
+
+    @property
+    def fps(self):
+        return self.frames / self.wall_time if self.wall_time > 0 else 0.0
+
+    def summary(self):
+        times = self.compute_times if len(self.compute_times) > 0 else np.zeros(1)
+        return {
+            "frames": self.frames,
+            "resets": self.resets,
+            "virtual_distance": self.virtual_distance,
+            "physical_distance": self.physical_distance,
+            "resets_per_meter": self.resets_per_meter,
+            "compute_mean_ms": float(times.mean() * 1000),
+            "compute_p50_ms": float(np.percentile(times, 50) * 1000),
+            "compute_p99_ms": float(np.percentile(times, 99) * 1000),
+            "compute_max_ms": float(times.max() * 1000),
+            "wall_time": self.wall_time,
+            "fps": self.fps,
+        }
+
+def free_start(physical_space, spacing = 0.1):
+    """
+    The free position closest to the center of the space, searched on a grid of the given spacing (m).
+    """
+    c_x, c_y = physical_space.get_center()
+    if not physical_space.in_obstacle(c_x, c_y):
+        return c_x, c_y
+    xs = [p[0] for p in physical_space.border]
+    ys = [p[1] for p in physical_space.border]
+    gx, gy = np.meshgrid(np.arange(min(xs), max(xs), spacing), np.arange(min(ys), max(ys), spacing))
+    gx = gx.ravel()
+    gy = gy.ravel()
+    free = ~physical_space.in_obstacle_many(gx, gy)
+    if not free.any():
+        raise ValueError("the physical space has no free position")
+    gx = gx[free]
+    gy = gy[free]
+    i = int(np.argmin((gx - c_x) ** 2 + (gy - c_y) ** 2))
+    return float(gx[i]), float(gy[i])
+
+def simulate(controller, physical_space, path, n_frames, delta_t = DELTA_T, start = None):
+    """
+    controller: utils.controller.Controller, physical_space: Space, path: a path from utils.paths.
+    start: physical (x, y, angle) of the user, defaults to the free position closest to the center, facing +x.
+    Stops after n_frames or when the path ends.
+    """
+    space = physical_space
+    if controller.prepare_space is not None:
+        space = controller.prepare_space(physical_space)
+    if start is None:
+        x, y = free_start(physical_space)
+        angle = 0.0
+    else:
+        x, y, angle = start
+
+    resets = 0
+    frames = 0
+    virtual_distance = 0.0
+    physical_distance = 0.0
+    need_reset = False
+    compute_times = []
+    clock = time.perf_counter
+
+    r_time = clock()
+    for v, w in islice(path.frames(delta_t), n_frames):
+        frames += 1
+        user = UserInfo(x, y, angle, v, w)
+        if need_reset:
+            t = clock()
+            user = controller.update_reset(user, space, delta_t)
+            compute_times.append(clock() - t)
+            resets += 1
+            need_reset = False
+        else:
+            virtual_distance += abs(v)
+            has_reset = False
+            t = clock()
+            if controller.universal:
+                user, has_reset = controller.update_user(user, space, delta_t)
+                compute_times.append(clock() - t)
+                if has_reset:
+                    resets += 1
+            else:
+                trans_gain, rot_gain, cur_gain_r, cur_direction = controller.calc_gain(user, space, delta_t)
+                compute_times.append(clock() - t)
+                user = calc_move_with_gain(user, trans_gain, rot_gain, cur_gain_r, cur_direction / abs(cur_direction))
+            if physical_space.in_obstacle(user.x, user.y):
+                need_reset = True
+                continue
+            if not has_reset:
+                physical_distance += math.hypot(user.x - x, user.y - y)
+        x, y, angle = user.x, user.y, user.angle
+    wall_time = clock() - r_time
+
+    return SimulationResult(frames, resets, virtual_distance, physical_distance, compute_times, wall_time)
+
+class CrowdResult:
+    """
+    users: simulated users, frames: simulated frames, resets: resets of all users,
+    virtual_distance / physical_distance: m walked by all users, wall_time: seconds for the whole run.
+    """
+    def __init__(self, users, frames, resets, virtual_distance, physical_distance, wall_time, delta_t):
+        self.users = users
+        self.frames = frames
+        self.resets = resets
+        self.virtual_distance = virtual_distance
+        self.physical_distance = physical_distance
+        self.wall_time = wall_time
+        self.delta_t = delta_t
+
+    @property
+    def resets_per_meter(self):
+        return self.resets / self.virtual_distance if self.virtual_distance > 0 else 0.0
+
+    @property
+    def realtime_factor(self):
+        # simulated time over wall time, > 1 is faster than real time
+        return self.frames * self.delta_t / self.wall_time if self.wall_time > 0 else 0.0
+
+    def summary(self):
+        return {
+            "users": self.users,
+            "frames": self.frames,
+            "resets": self.resets,
+            "virtual_distance": self.virtual_distance,
+            "physical_distance": self.physical_distance,
+            "resets_per_meter": self.resets_per_meter,
+            "frame_ms": self.wall_time / self.frames * 1000 if self.frames > 0 else 0.0,
+            "wall_time": self.wall_time,
+            "realtime_factor": self.realtime_factor,
+        }
+
+def random_starts(physical_space, n, seed = None):
+    """
+    n uniformly random free positions (x, y arrays) with random angles, by rejection sampling.
+    """
+    rng = np.random.default_rng(seed)
+    xs = [p[0] for p in physical_space.border]
+    ys = [p[1] for p in physical_space.border]
+    x = np.empty(0)
+    y = np.empty(0)
+    for _ in range(100):
+        if len(x) >= n:
+            break
+        cx = rng.uniform(min(xs), max(xs), 2 * n)
+        cy = rng.uniform(min(ys), max(ys), 2 * n)
+        free = ~physical_space.in_obstacle_many(cx, cy)
+        x = np.concatenate([x, cx[free]])
+        y = np.concatenate([y, cy[free]])
+    if len(x) < n:
+        raise ValueError("the physical space has no free position")
+    return x[:n], y[:n], rng.uniform(0, 2 * math.pi, n)
+
+def steer_to_center_batch(users, physical_space):
+    """
+    Vectorized steer-to-center gains, one value per user: rotate and curve towards the center of the space.
+    """
+    c_x, c_y = physical_space.get_center()
+    to_center = np.arctan2(c_y - users.y, c_x - users.x)
+    diff = np.mod(to_center - users.angle + math.pi, 2 * math.pi) - math.pi
+    cur_direction = np.where(diff > 0, 1.0, -1.0)
+    # amplify turns towards the center, damp turns away from it
+    rot_gain = np.where(users.w * cur_direction >= 0, MIN_ROT_GAIN, MAX_ROT_GAIN)
+    return 1.0, rot_gain, MIN_CUR_GAIN_R, cur_direction
+
+def simulate_crowd(physical_space, path, n_frames, starts, gains = steer_to_center_batch, delta_t = DELTA_T):
+    """
+    physical_space: Space, path: a batched path (utils.paths.RandomWalkBatch) yielding (v, w) arrays,
+    starts: (x, y, angle) arrays, one value per user.
+    gains: function (users, physical_space) -> (trans_gain, rot_gain, cur_gain_r, cur_direction),
+    scalars or arrays with one value per user.
+    A user whose new position lies in an obstacle stays at the pose before the collision and
+    turns around on the spot in the next frame (reset), as simulate does for a single user.
+    """
+    x, y, angle = starts
+    users = UserBatch(np.array(x, dtype=float), np.array(y, dtype=float), np.array(angle, dtype=float),
+                      np.zeros(len(x)), np.zeros(len(x)))
+    n = len(users)
+    need_reset = np.zeros(n, dtype=bool)
+    resets = 0
+    frames = 0
+    virtual_distance = 0.0
+    physical_distance = 0.0
+    clock = time.perf_counter
+
+    r_time = clock()
+    for v, w in islice(path.frames(delta_t), n_frames):
+        frames += 1
+        users.v = v
+        users.w = w
+        resetting = need_reset
+        moving = ~resetting
+        virtual_distance += float(np.abs(v[moving]).sum())
+        trans_gain, rot_gain, cur_gain_r, cur_direction = gains(users, physical_space)
+        moved = calc_move_with_gain_batch(users, trans_gain, rot_gain, cur_gain_r, cur_direction)
+        need_reset = moving & physical_space.in_obstacle_many(moved.x, moved.y)
+        accept = moving & ~need_reset
+        physical_distance += float(np.hypot(moved.x - users.x, moved.y - users.y)[accept].sum())
+        users.x = np.where(accept, moved.x, users.x)
+        users.y = np.where(accept, moved.y, users.y)
+        users.angle = np.where(accept, moved.angle, users.angle)
+        if resetting.any():
+            resets += int(resetting.sum())
+            users.angle[resetting] = np.mod(users.angle[resetting] + math.pi, 2 * math.pi)
+    wall_time = clock() - r_time
+
+    return CrowdResult(n, frames, resets, virtual_distance, physical_distance, wall_time, delta_t)
@@ -1,8 +1,12 @@
 import numpy as np
 import math
 from tqdm import tqdm, trange
+import shapely
+from shapely import STRtree
 from shapely.geometry import Point
 from shapely.geometry.polygon import Polygon
+from utils.sdf import SDF_RESOLUTION, SignedDistanceField
+from utils.segment_grid import SegmentGrid
 
 class UserInfo:
     """
@@ -19,31 +23,153 @@ class UserInfo:
         self.v = v * meter_per_px
         self.w = w
 
+class UserBatch:
+    """
+    Many users as a structure of arrays: x, y, angle, v and w are float arrays of the
+    same length, in the units of UserInfo.
+    """
+    def __init__(self, x, y, angle, v, w, meter_per_px = 1):
+        self.x = np.asarray(x, dtype=float) * meter_per_px
+        self.y = np.asarray(y, dtype=float) * meter_per_px
+        self.angle = np.asarray(angle, dtype=float)
+        self.v = np.asarray(v, dtype=float) * meter_per_px
+        self.w = np.asarray(w, dtype=float)
+
+    @classmethod
+    def from_users(cls, users):
+        return cls([u.x for u in users], [u.y for u in users], [u.angle for u in users],
+                   [u.v for u in users], [u.w for u in users])
+
+    def __len__(self):
+        return len(self.x)
+
+    def user(self, i):
+        return UserInfo(float(self.x[i]), float(self.y[i]), float(self.angle[i]), float(self.v[i]), float(self.w[i]))
+
+    def copy(self):
+        return UserBatch(self.x.copy(), self.y.copy(), self.angle.copy(), self.v.copy(), self.w.copy())
+
 class Space:
     """
     The representation of the physical space.
     We consider it as a polygon space with polygonal obstacles obstacle_list.
     Additionally, we record the position of the user (user_x, user_y), its angle (user_angle) and velocity (user_v) and angular velocity (user_w).
     All lengths are in meters (m).
+    The shapely geometry used for collision checks is built once and cached: the border
+    and every obstacle are prepared polygons, and the obstacles are indexed by an STRtree.
     """
     def __init__(self, border, raw_obstacle_list, meter_per_px = 1):
         self.border= [(t['x']*meter_per_px,t['y']*meter_per_px) for t in border]
         self.obstacle_list = []
+        self._border_polygon = None
+        self._obstacle_polygons = None
+        self._obstacle_tree = None
+        # signed distance field, built on demand by build_sdf
+        self.sdf = None
+        self._segment_grid = None
+        # levels of detail, built on demand by build_levels
+        self.levels = None
         for raw_obstacle in raw_obstacle_list:
             obstacle = [(t['x']*meter_per_px,t['y']*meter_per_px) for t in raw_obstacle]
             self.add_obstacle(obstacle)
-        
+        self.build_geometry()
+
     def add_obstacle(self, obstacle):
         self.obstacle_list.append(obstacle)
+        # invalidate the cached geometry, it is rebuilt on the next query
+        self._obstacle_tree = None
+        self.sdf = None
+        self._segment_grid = None
+        self.levels = None
+
+    def build_geometry(self):
+        """
+        Build the prepared border polygon, the prepared obstacle polygons and the STRtree over obstacles.
+        """
+        self._border_polygon = Polygon(self.border)
+        shapely.prepare(self._border_polygon)
+        self._obstacle_polygons = np.array([Polygon(obstacle) for obstacle in self.obstacle_list], dtype=object)
+        shapely.prepare(self._obstacle_polygons)
+        self._obstacle_tree = STRtree(self._obstacle_polygons)
+
+    def build_sdf(self, resolution = SDF_RESOLUTION):
+        """
+        Sample the signed distance field of the space (utils.sdf) at the given resolution (m). Once built,
+        it answers distance and gradient queries and speeds up in_obstacle / in_obstacle_many away from boundaries.
+        """
+        self.sdf = SignedDistanceField(self, resolution)
+        return self.sdf
+
+    def build_levels(self, tolerances = None, start = None):
+        """
+        Simplified copies of the space (utils.lod), one per tolerance in m, each with an error bound.
+        start: physical (x, y) of the user, used to tell the reachable free space, if known.
+        """
+        from utils.lod import LOD_TOLERANCES, build_levels
+        self.levels = build_levels(self, LOD_TOLERANCES if tolerances is None else tolerances, start)
+        return self.levels
+
+    def get_level(self, max_error = 0.0):
+        """
+        The coarsest level whose error bound is at most max_error (m), or the space itself without levels.
+        """
+        best = self
+        for level in self.levels or ():
+            if level.error_bound <= max_error and (best is self or level.segment_count() < best.segment_count()):
+                best = level
+        return best
+
+    def segment_grid(self):
+        """
+        The uniform grid over the wall segments (utils.segment_grid), built on first use: raycasts and
+        time-to-collision queries whose cost does not grow with the number of segments.
+        """
+        if self._segment_grid is None:
+            self._segment_grid = SegmentGrid(self.border, self.obstacle_list)
+        return self._segment_grid
 
     def in_obstacle(self, x, y):
-        if not Polygon(self.border).contains(Point(x,y)):
+        if self.sdf is not None:
+            return self.sdf.in_obstacle(x, y)
+        return self.in_obstacle_exact(x, y)
+
+    def in_obstacle_many(self, xs, ys):
+        """
+        Batched in_obstacle. xs, ys: array-likes of the same shape.
+        Return a boolean array of that shape.
+        """
+        if self.sdf is not None:
+            return self.sdf.in_obstacle_many(xs, ys)
+        return self.in_obstacle_exact_many(xs, ys)
+
+    def in_obstacle_exact(self, x, y):
+        if self._obstacle_tree is None:
+            self.build_geometry()
+        if not shapely.contains_xy(self._border_polygon, x, y):
             return True
-        for obstacle in self.obstacle_list:
-            polygon = Polygon(obstacle)
-            if polygon.contains(Point(x,y)):
-                return True
-        return False
+        # bounding-box candidates from the tree, then the exact test on the prepared polygons
+        candidates = self._obstacle_tree.query(Point(x, y))
+        if len(candidates) == 0:
+            return False
+        return bool(shapely.contains_xy(self._obstacle_polygons[candidates], x, y).any())
+
+    def in_obstacle_exact_many(self, xs, ys):
+        # in_obstacle_exact for arrays
+        if self._obstacle_tree is None:
+            self.build_geometry()
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        shape = np.broadcast_shapes(xs.shape, ys.shape)
+        xs = np.broadcast_to(xs, shape).ravel()
+        ys = np.broadcast_to(ys, shape).ravel()
+        result = ~shapely.contains_xy(self._border_polygon, xs, ys)
+        inside = np.flatnonzero(~result)
+        if len(inside) > 0 and len(self._obstacle_polygons) > 0:
+            point_idx, obstacle_idx = self._obstacle_tree.query(shapely.points(xs[inside], ys[inside]))
+            point_idx = inside[point_idx]
+            hit = shapely.contains_xy(self._obstacle_polygons[obstacle_idx], xs[point_idx], ys[point_idx])
+            result[point_idx[hit]] = True
+        return result.reshape(shape)
     
     def get_center(self):
         c_x = sum([t[0] for t in self.border])/len(self.border)
@@ -0,0 +1,224 @@
+"""
+Compact recording of websocket sessions and memory-mapped replay.
+
+A session (one start ... end) is stored as a directory:
+
+    meta.json        start geometry ("physical" of the start message), meter_per_px, mode
+    <column>.npy     one fixed-width array per column, see COLUMNS
+
+Frames are buffered and appended to raw <column>.bin files while the session
+runs; close() turns them into .npy files. TraceReader memory-maps the columns,
+so multi-hour sessions open instantly and frames are read as zero-copy views.
+A session that was not closed (server killed) is still readable from the .bin files.
+"""
+import json
+import os
+import time
+import numpy as np
+from utils.constants import *
+from utils.space import Space, UserInfo
+
+# inputs as received in "running" messages, then the controller outputs.
+# Outputs that do not apply to a frame (gains of a reset frame, pose of a gain frame) are NaN.
+COLUMNS = {
+    "user_x": np.float64,
+    "user_y": np.float64,
+    "user_direction": np.float64,
+    "user_v": np.float64,
+    "user_w": np.float64,
+    "delta_t": np.float64,
+    "need_reset": np.uint8,
+    "trans_gain": np.float64,
+    "rot_gain": np.float64,
+    "cur_gain": np.float64,
+    "out_x": np.float64,
+    "out_y": np.float64,
+    "out_direction": np.float64,
+    "reset": np.uint8,
+}
+INPUT_COLUMNS = ("user_x", "user_y", "user_direction", "user_v", "user_w", "delta_t", "need_reset")
+OUTPUT_COLUMNS = ("trans_gain", "rot_gain", "cur_gain", "out_x", "out_y", "out_direction", "reset")
+
+class TraceRecorder:
+    """
+    Record one session into directory. Call frame() for every running message and close() at end.
+    """
+    def __init__(self, directory, physical, meter_per_px = METER_PER_PX, universal = False, controller = "", chunk = 4096):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta = {
+            "physical": physical,
+            "meter_per_px": meter_per_px,
+            "universal": universal,
+            "controller": controller,
+            "created": time.time(),
+        }
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        self.chunk = chunk
+        self.count = 0
+        self.closed = False
+        self._buffer = {name: np.empty(chunk, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._n = 0
+        self._files = {name: open(os.path.join(directory, name + ".bin"), "wb") for name in COLUMNS}
+
+    @classmethod
+    def for_session(cls, root, physical, **kwargs):
+        # a new, uniquely named session directory under root
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() % 1000000:06d}"
+        return cls(os.path.join(root, name), physical, **kwargs)
+
+    def frame(self, data, reply):
+        """
+        data: the decoded running message, reply: the dict sent back (running or running-gain).
+        """
+        physical = data["physical"]
+        buf = self._buffer
+        i = self._n
+        buf["user_x"][i] = physical["user_x"]
+        buf["user_y"][i] = physical["user_y"]
+        buf["user_direction"][i] = physical["user_direction"]
+        buf["user_v"][i] = data["user_v"]
+        buf["user_w"][i] = data["user_w"]
+        buf["delta_t"][i] = data["delta_t"]
+        buf["need_reset"][i] = bool(data["need_reset"])
+        buf["trans_gain"][i] = reply.get("trans_gain", np.nan)
+        buf["rot_gain"][i] = reply.get("rot_gain", np.nan)
+        buf["cur_gain"][i] = reply.get("cur_gain", np.nan)
+        buf["out_x"][i] = reply.get("user_x", np.nan)
+        buf["out_y"][i] = reply.get("user_y", np.nan)
+        buf["out_direction"][i] = reply.get("user_direction", np.nan)
+        buf["reset"][i] = bool(reply.get("reset", False))
+        self._n += 1
+        self.count += 1
+        if self._n == self.chunk:
+            self.flush()
+
+    def flush(self):
+        for name, f in self._files.items():
+            f.write(self._buffer[name][:self._n].tobytes())
+            f.flush()
+        self._n = 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        for name, f in self._files.items():
+            f.close()
+            raw = os.path.join(self.directory, name + ".bin")
+            np.save(os.path.join(self.directory, name + ".npy"), np.fromfile(raw, dtype=COLUMNS[name]))
+            os.remove(raw)
+        self.closed = True
+
+class TraceReader:
+    """
+    Memory-mapped view of a recorded session. columns[name] is a read-only array over the file.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.columns = {}
+        for name, dtype in COLUMNS.items():
+            npy = os.path.join(directory, name + ".npy")
+            if os.path.exists(npy):
+                self.columns[name] = np.load(npy, mmap_mode="r")
+            else:
+                raw = os.path.join(directory, name + ".bin")
+                if os.path.getsize(raw) == 0:
+                    self.columns[name] = np.empty(0, dtype=dtype)
+                else:
+                    self.columns[name] = np.memmap(raw, dtype=dtype, mode="r")
+        # an unclosed session may have columns flushed to different lengths
+        n = min(len(c) for c in self.columns.values())
+        self.columns = {name: c[:n] for name, c in self.columns.items()}
+
+    def __len__(self):
+        return len(self.columns["user_x"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def meter_per_px(self):
+        return self.meta["meter_per_px"]
+
+    @property
+    def universal(self):
+        return self.meta["universal"]
+
+    def space(self):
+        physical = self.meta["physical"]
+        return Space(physical["border"], physical["obstacle_list"], self.meter_per_px)
+
+    def inputs(self, start = 0, stop = None):
+        """
+        Yield the recorded inputs of every frame as tuples in INPUT_COLUMNS order.
+        """
+        cols = [self.columns[name][start:stop] for name in INPUT_COLUMNS]
+        for row in zip(*cols):
+            yield row
+
+def find_sessions(root):
+    # session directories under root, oldest first
+    sessions = [os.path.join(root, d) for d in sorted(os.listdir(root))]
+    return [d for d in sessions if os.path.exists(os.path.join(d, "meta.json"))]
+
+class ReplayResult:
+    """
+    outputs: dict of OUTPUT_COLUMNS arrays produced by the replayed controller.
+    max_diff(reader): largest absolute difference to the recorded outputs, per column.
+    """
+    def __init__(self, outputs, compute_times, start = 0):
+        self.outputs = outputs
+        self.compute_times = compute_times
+        self.start = start
+
+    def max_diff(self, reader):
+        diff = {}
+        for name in OUTPUT_COLUMNS:
+            a = np.asarray(self.outputs[name], dtype=float)
+            b = np.asarray(reader[name][self.start:self.start + len(a)], dtype=float)
+            both = ~(np.isnan(a) & np.isnan(b))
+            d = np.abs(a[both] - b[both])
+            d[np.isnan(d)] = np.inf # NaN on one side only: the frame kind differs
+            diff[name] = float(d.max()) if len(d) > 0 else 0.0
+        return diff
+
+def replay(reader, controller, start = 0, stop = None):
+    """
+    Feed the recorded inputs of a session through controller (utils.controller.Controller),
+    the same way client_base.user_loop does, and collect its outputs.
+    The controller mode (gain / universal) is the controller's, not necessarily the recorded one.
+    """
+    meter_per_px = reader.meter_per_px
+    space = reader.space()
+    if controller.prepare_space is not None:
+        space = controller.prepare_space(space)
+    n = len(reader.columns["user_x"][start:stop])
+    outputs = {name: np.full(n, np.nan) for name in OUTPUT_COLUMNS}
+    outputs["reset"] = np.zeros(n, dtype=np.uint8)
+    compute_times = np.empty(n)
+    clock = time.perf_counter
+    for i, (x, y, direction, v, w, delta_t, need_reset) in enumerate(reader.inputs(start, stop)):
+        user = UserInfo(x, y, direction, v, w, meter_per_px)
+        t = clock()
+        if need_reset:
+            user = controller.update_reset(user, space, delta_t)
+            has_reset = True
+        elif controller.universal:
+            user, has_reset = controller.update_user(user, space, delta_t)
+        else:
+            trans_gain, rot_gain, cur_gain_r, cur_direction = controller.calc_gain(user, space, delta_t)
+            compute_times[i] = clock() - t
+            outputs["trans_gain"][i] = trans_gain
+            outputs["rot_gain"][i] = rot_gain
+            outputs["cur_gain"][i] = cur_gain_r * cur_direction / abs(cur_direction)
+            continue
+        compute_times[i] = clock() - t
+        outputs["out_x"][i] = user.x / meter_per_px
+        outputs["out_y"][i] = user.y / meter_per_px
+        outputs["out_direction"][i] = user.angle
+        outputs["reset"][i] = has_reset
+    return ReplayResult(outputs, compute_times, start)
@@ -0,0 +1,65 @@
+"""
+Binary wire format for the running loop.
+
+The client asks for it by adding "protocol": "binary" to its start message; the
+server confirms with "protocol": "binary" in the start reply. After that, running
+messages and their replies may travel as websocket binary frames with the fixed
+little-endian layouts below, while start, end and stats stay JSON text frames.
+A text frame is always accepted and answered with JSON, so JSON remains the
+fallback for clients that do not negotiate.
+"""
+import struct
+
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+
+TAG_RUNNING = 1
+TAG_RUNNING_REPLY = 2
+TAG_RUNNING_GAIN_REPLY = 3
+
+# tag, user_x, user_y, user_direction, user_v, user_w, delta_t, need_reset
+RUNNING = struct.Struct("<B6d?")
+# tag, user_x, user_y, user_direction, reset
+RUNNING_REPLY = struct.Struct("<B3d?")
+# tag, trans_gain, rot_gain, cur_gain, reset
+RUNNING_GAIN_REPLY = struct.Struct("<B3d?")
+
+def encode_running(user_x, user_y, user_direction, user_v, user_w, delta_t, need_reset):
+    return RUNNING.pack(TAG_RUNNING, user_x, user_y, user_direction, user_v, user_w, delta_t, need_reset)
+
+def decode_running(buf):
+    """
+    A binary running frame as the dict the JSON running message decodes to.
+    """
+    tag, user_x, user_y, user_direction, user_v, user_w, delta_t, need_reset = RUNNING.unpack(buf)
+    if tag != TAG_RUNNING:
+        raise ValueError(f"unexpected binary frame tag {tag}")
+    return {
+        "type": "running",
+        "physical": {"user_x": user_x, "user_y": user_y, "user_direction": user_direction},
+        "user_v": user_v,
+        "user_w": user_w,
+        "delta_t": delta_t,
+        "need_reset": need_reset,
+    }
+
+def encode_reply(reply):
+    """
+    A running or running-gain reply dict as a binary frame.
+    """
+    if reply["type"] == "running":
+        return RUNNING_REPLY.pack(TAG_RUNNING_REPLY, reply["user_x"], reply["user_y"], reply["user_direction"], reply["reset"])
+    return RUNNING_GAIN_REPLY.pack(TAG_RUNNING_GAIN_REPLY, reply["trans_gain"], reply["rot_gain"], reply["cur_gain"], reply["reset"])
+
+def decode_reply(buf):
+    """
+    A binary reply frame as the dict the JSON reply decodes to.
+    """
+    tag = buf[0]
+    if tag == TAG_RUNNING_REPLY:
+        _, user_x, user_y, user_direction, reset = RUNNING_REPLY.unpack(buf)
+        return {"type": "running", "user_x": user_x, "user_y": user_y, "user_direction": user_direction, "reset": reset}
+    if tag == TAG_RUNNING_GAIN_REPLY:
+        _, trans_gain, rot_gain, cur_gain, reset = RUNNING_GAIN_REPLY.unpack(buf)
+        return {"type": "running-gain", "trans_gain": trans_gain, "rot_gain": rot_gain, "cur_gain": cur_gain, "reset": reset}
+    raise ValueError(f"unexpected binary frame tag {tag}")
@@ -0,0 +1,238 @@
+"""
+Event-based angular sweep for visibility polygons (Asano / Lee style).
+
+Every segment covers an angular interval as seen from the viewer. Sweeping the
+ray angles in increasing order, a segment is inserted into the active-edge
+structure when the sweep reaches the start of its interval and removed once the
+sweep has passed its end. The active edges are kept in an indexed binary heap
+ordered by distance along the ray, so the nearest hit of every ray is the heap
+top. Each segment is inserted and removed once, giving O(n log n) per call
+instead of testing every ray against every segment.
+
+The ordering assumes segments do not cross each other (they may share
+endpoints), which holds for a simple border with disjoint obstacles.
+segments_cross detects the other rooms (overlapping obstacles, obstacles
+crossing the border); VisPolyRdw casts their rays one by one instead.
+"""
+import math
+import numpy as np
+from .vec2 import Vec2
+from .geometry import ray_line_intersect_xy
+
+TWO_PI = 2.0 * math.pi
+# intervals are widened slightly so rounding never deactivates an edge a ray still hits
+ANGLE_SLACK = 1e-12
+
+
+class _Edge:
+    __slots__ = ('lo', 'hi', 'p1', 'p2', 'index', 'heap_pos')
+
+    def __init__(self, lo, hi, p1, p2, index):
+        self.lo = lo
+        self.hi = hi
+        self.p1 = p1
+        self.p2 = p2
+        self.index = index
+        self.heap_pos = -1
+
+
+def _ray_distance(ox, oy, dx, dy, edge):
+    # distance from the origin to the segment's supporting line along (dx, dy)
+    vx = edge.p2.x - edge.p1.x
+    vy = edge.p2.y - edge.p1.y
+    denom = dx * vy - dy * vx
+    if abs(denom) < 1e-15:
+        # the segment is (almost) radial, its nearest endpoint is what the ray sees
+        return min(math.hypot(edge.p1.x - ox, edge.p1.y - oy), math.hypot(edge.p2.x - ox, edge.p2.y - oy))
+    return ((edge.p1.x - ox) * vy - (edge.p1.y - oy) * vx) / denom
+
+
+class ActiveEdges:
+    """
+    Indexed binary min-heap of the edges crossed by the sweep ray, nearest first.
+    Two edges are compared along the ray through the middle of their common angular
+    interval, so the comparison does not depend on the current sweep angle and the
+    heap invariant survives while the sweep advances.
+    """
+    def __init__(self, origin: Vec2):
+        self.ox = origin.x
+        self.oy = origin.y
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _less(self, a, b):
+        mid = (max(a.lo, b.lo) + min(a.hi, b.hi)) * 0.5
+        dx = math.cos(mid)
+        dy = math.sin(mid)
+        ta = _ray_distance(self.ox, self.oy, dx, dy, a)
+        tb = _ray_distance(self.ox, self.oy, dx, dy, b)
+        if ta != tb:
+            return ta < tb
+        return a.index < b.index
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        heap[i].heap_pos = i
+        heap[j].heap_pos = j
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not self._less(self.heap[i], self.heap[parent]):
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        n = len(self.heap)
+        while True:
+            smallest = i
+            left = 2 * i + 1
+            right = left + 1
+            if left < n and self._less(self.heap[left], self.heap[smallest]):
+                smallest = left
+            if right < n and self._less(self.heap[right], self.heap[smallest]):
+                smallest = right
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+    def push(self, edge):
+        edge.heap_pos = len(self.heap)
+        self.heap.append(edge)
+        self._sift_up(edge.heap_pos)
+
+    def remove(self, edge):
+        i = edge.heap_pos
+        if i < 0:
+            return
+        last = self.heap.pop()
+        edge.heap_pos = -1
+        if last is edge:
+            return
+        self.heap[i] = last
+        last.heap_pos = i
+        self._sift_up(i)
+        self._sift_down(last.heap_pos)
+
+    def top(self):
+        return self.heap[0] if self.heap else None
+
+
+def _orient(ax, ay, bx, by, cx, cy):
+    # sign of the turn a -> b -> c
+    return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+
+def segments_cross(seg_arr, block=512):
+    """
+    True when two of the (N, 2, 2) segments cross at a point interior to both, or overlap along
+    a common line; sharing an endpoint or ending on another segment is allowed.
+    """
+    n = len(seg_arr)
+    x1 = seg_arr[:, 0, 0]
+    y1 = seg_arr[:, 0, 1]
+    x2 = seg_arr[:, 1, 0]
+    y2 = seg_arr[:, 1, 1]
+    for start in range(0, n, block):
+        # rows: block of segments a, columns: every segment b
+        ax1 = x1[start:start + block, None]
+        ay1 = y1[start:start + block, None]
+        ax2 = x2[start:start + block, None]
+        ay2 = y2[start:start + block, None]
+        o1 = _orient(ax1, ay1, ax2, ay2, x1, y1)
+        o2 = _orient(ax1, ay1, ax2, ay2, x2, y2)
+        o3 = _orient(x1, y1, x2, y2, ax1, ay1)
+        o4 = _orient(x1, y1, x2, y2, ax2, ay2)
+        if ((o1 * o2 < 0) & (o3 * o4 < 0)).any():
+            return True
+        # collinear pairs overlapping with a positive length, along the longer axis of a
+        collinear = (o1 == 0) & (o2 == 0)
+        collinear[np.arange(len(ax1)), np.arange(start, start + len(ax1))] = False
+        if collinear.any():
+            along_x = np.abs(ax2 - ax1) >= np.abs(ay2 - ay1)
+            a_lo = np.where(along_x, np.minimum(ax1, ax2), np.minimum(ay1, ay2))
+            a_hi = np.where(along_x, np.maximum(ax1, ax2), np.maximum(ay1, ay2))
+            b_lo = np.where(along_x, np.minimum(x1, x2), np.minimum(y1, y2))
+            b_hi = np.where(along_x, np.maximum(x1, x2), np.maximum(y1, y2))
+            if (collinear & (np.minimum(a_hi, b_hi) > np.maximum(a_lo, b_lo))).any():
+                return True
+    return False
+
+
+def build_edges(pos: Vec2, segments, min_angle, max_angle):
+    # Angular interval [lo, hi] of every segment, unwrapped so that it overlaps the
+    # queried range [min_angle, max_angle]; an interval crossing the +-pi cut gets a
+    # second, shifted copy.
+    edges = []
+    for index, (p1, p2) in enumerate(segments):
+        a1 = math.atan2(p1.y - pos.y, p1.x - pos.x)
+        a2 = math.atan2(p2.y - pos.y, p2.x - pos.x)
+        span = (a2 - a1) % TWO_PI
+        if span == 0.0:
+            # radial segment, never hit by a ray (see ray_line_intersect)
+            continue
+        # keep the atan2 values themselves as bounds so that the rays cast exactly
+        # at an endpoint compare equal to it
+        lo, hi = (a2, a1) if span > math.pi else (a1, a2)
+        if hi < lo:
+            hi += TWO_PI
+        lo -= ANGLE_SLACK
+        hi += ANGLE_SLACK
+        edges.append(_Edge(lo, hi, p1, p2, index))
+        if hi - TWO_PI >= min_angle:
+            edges.append(_Edge(lo - TWO_PI, hi - TWO_PI, p1, p2, index))
+        if lo + TWO_PI <= max_angle:
+            edges.append(_Edge(lo + TWO_PI, hi + TWO_PI, p1, p2, index))
+    return edges
+
+
+def sweep_rays(pos: Vec2, segments, angles):
+    """
+    Nearest hit of every ray from pos. angles must be sorted ascending.
+    Return a list of (angle, Vec2 hit point), like the brute-force ray caster.
+    """
+    if not angles:
+        return []
+    edges = build_edges(pos, segments, angles[0], angles[-1])
+    starts = sorted(edges, key=lambda e: e.lo)
+    ends = sorted(edges, key=lambda e: e.hi)
+    active = ActiveEdges(pos)
+    si = 0
+    ei = 0
+    n = len(edges)
+    ox = pos.x
+    oy = pos.y
+
+    intersections = []
+    for ang in angles:
+        while si < n and starts[si].lo <= ang:
+            active.push(starts[si])
+            si += 1
+        while ei < n and ends[ei].hi < ang:
+            active.remove(ends[ei])
+            ei += 1
+        edge = active.top()
+        if edge is None:
+            continue
+        dx = math.cos(ang)
+        dy = math.sin(ang)
+        p1 = edge.p1
+        p2 = edge.p2
+        t = ray_line_intersect_xy(ox, oy, dx, dy, p1.x, p1.y, p2.x, p2.y)
+        if t == -1.0:
+            # The ray grazes an endpoint and rounding put it just outside the nearest
+            # edge; test every active edge, as the ray caster would.
+            t = float('inf')
+            for other in active.heap:
+                t_other = ray_line_intersect_xy(ox, oy, dx, dy, other.p1.x, other.p1.y, other.p2.x, other.p2.y)
+                if t_other != -1.0 and t_other < t:
+                    t = t_other
+            if t == float('inf'):
+                continue
+        intersections.append((ang, Vec2(ox + dx * t, oy + dy * t)))
+    return intersections
@@ -0,0 +1,102 @@
+"""
+Visibility environments compiled once per session.
+
+get_vis_poly accepts either the env dict layout ('vertices' / 'obstacles' lists
+of Vec2) or a CompiledEnv, which additionally keeps the segment list, the
+(N, 2, 2) segment array used by the NumPy backend and bounding boxes, so none of
+it has to be rebuilt per frame.
+"""
+import threading
+import numpy as np
+from .vec2 import Vec2
+from .numpy_backend import segment_array
+from .angular_sweep import segments_cross
+
+
+def env_segments(env):
+    if isinstance(env, CompiledEnv):
+        return env.segments
+    segments = []
+    verts = env.get('vertices', [])
+    for i in range(len(verts)):
+        p1 = verts[i]
+        p2 = verts[(i + 1) % len(verts)]
+        segments.append((p1, p2))
+    for obs in env.get('obstacles', []):
+        for i in range(len(obs)):
+            p1 = obs[i]
+            p2 = obs[(i + 1) % len(obs)]
+            segments.append((p1, p2))
+    return segments
+
+
+def _bbox(pts):
+    xs = [p.x for p in pts]
+    ys = [p.y for p in pts]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+class CompiledEnv:
+    """
+    vertices: border polygon, obstacles: list of obstacle polygons, both given as (x, y) tuples or Vec2.
+    seg_array: (N, 2, 2) float array of the segments, seg_bboxes: (N, 4) array of (min_x, min_y, max_x, max_y).
+    bbox: bounding box of the border, obstacle_bboxes: one per obstacle.
+    """
+    def __init__(self, vertices, obstacles=()):
+        self.vertices = [Vec2(*p) if isinstance(p, tuple) else Vec2(p.x, p.y) for p in vertices]
+        self.obstacles = [[Vec2(*p) if isinstance(p, tuple) else Vec2(p.x, p.y) for p in obs] for obs in obstacles]
+        self.segments = env_segments({'vertices': self.vertices, 'obstacles': self.obstacles})
+        self.seg_array = segment_array(self.segments)
+        self.seg_bboxes = np.concatenate([self.seg_array.min(axis=1), self.seg_array.max(axis=1)], axis=1) \
+            if len(self.segments) > 0 else np.empty((0, 4))
+        self.bbox = _bbox(self.vertices) if self.vertices else None
+        self.obstacle_bboxes = [_bbox(obs) for obs in self.obstacles if obs]
+        self._crossing = None
+
+    @property
+    def crossing(self):
+        # whether some segments cross (see angular_sweep.segments_cross), computed on first use
+        if self._crossing is None:
+            self._crossing = segments_cross(self.seg_array)
+        return self._crossing
+
+    def get(self, key, default=None):
+        # dict-style access, so code written against env dicts keeps working
+        if key == 'vertices':
+            return self.vertices
+        if key == 'obstacles':
+            return self.obstacles
+        return default
+
+
+# crossing flags of env dicts, by segment coordinates: callers often build a new dict with the
+# same room every frame, so the dict itself cannot be the key
+CROSSING_CACHE = 8
+_crossings = {}
+_crossings_lock = threading.Lock()
+
+
+def crossing(env, segments):
+    # CompiledEnv.crossing, or computed once for the segments of an env dict
+    if isinstance(env, CompiledEnv):
+        return env.crossing
+    seg_arr = segment_array(segments)
+    key = seg_arr.tobytes()
+    with _crossings_lock:
+        flag = _crossings.get(key)
+    if flag is None:
+        flag = segments_cross(seg_arr)
+        with _crossings_lock:
+            if len(_crossings) >= CROSSING_CACHE:
+                del _crossings[next(iter(_crossings))]
+            _crossings[key] = flag
+    return flag
+
+
+def shares_border(physical, virtual):
+    # True when virtual is a CompiledEnv of the border of the CompiledEnv physical alone: the border
+    # segments come first in both, so the segments of virtual are a prefix of those of physical
+    if not isinstance(physical, CompiledEnv) or not isinstance(virtual, CompiledEnv) or virtual.obstacles:
+        return False
+    n = len(virtual.seg_array)
+    return n <= len(physical.seg_array) and np.array_equal(physical.seg_array[:n], virtual.seg_array)
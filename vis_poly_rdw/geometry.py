@@ -11,39 +11,59 @@ def sign(v):
     if v < 0: return -1
     return 0
 
-def orient(a: Vec2, b: Vec2, c: Vec2):
-    # cross of (b-a) x (c-b)
-    return sign((b - a).cross(c - b))
+# The *_xy functions take raw floats and allocate nothing; the Vec2 versions below
+# unpack their arguments and call them.
 
-def ray_line_intersect(ray_origin: Vec2, ray_dir: Vec2, p1: Vec2, p2: Vec2):
-    # Solve ray_origin + t*ray_dir = p1 + u*(p2-p1)
-    v = p2 - p1
-    denom = ray_dir.cross(v)
+def orient_xy(ax, ay, bx, by, cx, cy):
+    return sign((bx - ax) * (cy - by) - (by - ay) * (cx - bx))
+
+def ray_line_intersect_xy(ox, oy, dx, dy, x1, y1, x2, y2):
+    vx = x2 - x1
+    vy = y2 - y1
+    denom = dx * vy - dy * vx
     if abs(denom) < EPS:
         return -1.0
-    w = p1 - ray_origin
-    t = w.cross(v) / denom
-    u = w.cross(ray_dir) / denom
+    wx = x1 - ox
+    wy = y1 - oy
+    t = (wx * vy - wy * vx) / denom
+    u = (wx * dy - wy * dx) / denom
     if t >= 0 and 0.0 <= u <= 1.0:
         return t
     return -1.0
 
-def polygon_area(pts):
-    # pts: list of Vec2 or list of tuple
+def polygon_area_xy(xs, ys):
     area = 0.0
-    n = len(pts)
-    for i in range(n):
-        x1, y1 = pts[i].x, pts[i].y
-        x2, y2 = pts[(i + 1) % n].x, pts[(i + 1) % n].y
-        area += x1 * y2 - x2 * y1
+    n = len(xs)
+    if n == 0:
+        return area
+    for i in range(n - 1):
+        area += xs[i] * ys[i + 1] - xs[i + 1] * ys[i]
+    area += xs[n - 1] * ys[0] - xs[0] * ys[n - 1]
     return abs(area) * 0.5
 
+def signed_angle_xy(ax, ay, bx, by):
+    return math.atan2(ax * by - ay * bx, ax * bx + ay * by)
+
+def orient(a: Vec2, b: Vec2, c: Vec2):
+    # cross of (b-a) x (c-b)
+    return orient_xy(a.x, a.y, b.x, b.y, c.x, c.y)
+
+def ray_line_intersect(ray_origin: Vec2, ray_dir: Vec2, p1: Vec2, p2: Vec2):
+    # Solve ray_origin + t*ray_dir = p1 + u*(p2-p1)
+    return ray_line_intersect_xy(ray_origin.x, ray_origin.y, ray_dir.x, ray_dir.y, p1.x, p1.y, p2.x, p2.y)
+
+def polygon_area(pts):
+    # pts: list of Vec2 or list of tuple
+    if pts and isinstance(pts[0], tuple):
+        return polygon_area_xy([p[0] for p in pts], [p[1] for p in pts])
+    return polygon_area_xy([p.x for p in pts], [p.y for p in pts])
+
 def normalize(v: Vec2):
     return v.normalized()
 
 def signed_angle(a: Vec2, b: Vec2):
     # angle from a to b (signed)
-    return math.atan2(a.cross(b), a.dot(b))
+    return signed_angle_xy(a.x, a.y, b.x, b.y)
 
 def angle(a: Vec2, b: Vec2):
     # unsigned angle
@@ -0,0 +1,104 @@
+"""
+NumPy ray caster for the visibility polygon.
+
+Segments are stored as a contiguous (N, 2, 2) float array and all rays are
+intersected with all segments in one broadcasted operation (rays are processed
+in blocks to bound memory), followed by a nearest-hit reduction. It evaluates
+the same formula as geometry.ray_line_intersect, so the hit points match the
+Python ray caster up to floating point rounding.
+"""
+import numpy as np
+from .vec2 import Vec2, Vec2Array
+from .geometry import EPS
+
+# upper bound on rays x segments evaluated at once
+BLOCK_SIZE = 1 << 18
+
+
+def segment_array(segments):
+    # list of (Vec2, Vec2) -> (N, 2, 2) array of [[x1, y1], [x2, y2]]
+    arr = np.empty((len(segments), 2, 2), dtype=np.float64)
+    for i, (p1, p2) in enumerate(segments):
+        arr[i, 0, 0] = p1.x
+        arr[i, 0, 1] = p1.y
+        arr[i, 1, 0] = p2.x
+        arr[i, 1, 1] = p2.y
+    return arr
+
+
+def _ray_blocks(ox, oy, angles, seg_arr):
+    # (start, stop, (rays, N) distances along the rays to every segment, inf where missed) per block of rays
+    dx = np.cos(angles)[:, None]
+    dy = np.sin(angles)[:, None]
+    vx = seg_arr[:, 1, 0] - seg_arr[:, 0, 0]
+    vy = seg_arr[:, 1, 1] - seg_arr[:, 0, 1]
+    wx = seg_arr[:, 0, 0] - ox
+    wy = seg_arr[:, 0, 1] - oy
+    w_cross_v = wx * vy - wy * vx
+
+    step = max(1, BLOCK_SIZE // len(seg_arr))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(angles), step):
+            bx = dx[start:start + step]
+            by = dy[start:start + step]
+            denom = bx * vy - by * vx
+            t = w_cross_v / denom
+            u = (wx * by - wy * bx) / denom
+            valid = (np.abs(denom) >= EPS) & (t >= 0.0) & (u >= 0.0) & (u <= 1.0)
+            yield start, start + step, np.where(valid, t, np.inf)
+
+
+def nearest_hits(ox, oy, angles, seg_arr):
+    """
+    Distance along every ray to the nearest segment, inf where the ray hits nothing.
+    angles: (R,) array, seg_arr: (N, 2, 2) array.
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    best = np.full(len(angles), np.inf)
+    if len(seg_arr) == 0 or len(angles) == 0:
+        return best
+    for start, stop, t in _ray_blocks(ox, oy, angles, seg_arr):
+        best[start:stop] = t.min(axis=1)
+    return best
+
+
+def nearest_hits_split(ox, oy, angles, seg_arr, split):
+    """
+    nearest_hits for seg_arr[:split] and for seg_arr[split:], from one pass over all segments.
+    Their minimum is nearest_hits for seg_arr.
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    first = np.full(len(angles), np.inf)
+    second = np.full(len(angles), np.inf)
+    if len(seg_arr) == 0 or len(angles) == 0:
+        return first, second
+    for start, stop, t in _ray_blocks(ox, oy, angles, seg_arr):
+        if split > 0:
+            first[start:stop] = t[:, :split].min(axis=1)
+        if split < len(seg_arr):
+            second[start:stop] = t[:, split:].min(axis=1)
+    return first, second
+
+
+def hit_points(pos: Vec2, seg_arr, angles):
+    """
+    Angles of the rays that hit a segment, and their hit points as a Vec2Array.
+    """
+    return points_from_hits(pos, angles, nearest_hits(pos.x, pos.y, angles, seg_arr))
+
+
+def points_from_hits(pos: Vec2, angles, t):
+    # hit_points from the distances of nearest_hits
+    hit = np.isfinite(t)
+    angles = np.asarray(angles, dtype=np.float64)[hit]
+    t = t[hit]
+    return angles, Vec2Array.from_xy(pos.x + np.cos(angles) * t, pos.y + np.sin(angles) * t)
+
+
+def cast_rays_np(pos: Vec2, seg_arr, angles):
+    """
+    Vectorized counterpart of vis_poly_rdw.cast_rays.
+    Return a list of (angle, Vec2 hit point) for the rays that hit a segment.
+    """
+    angles, pts = hit_points(pos, seg_arr, angles)
+    return list(zip(angles.tolist(), pts))
@@ -1,7 +1,10 @@
 import math
+import numpy as np
 
 
 class Vec2:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x: float = 0.0, y: float = 0.0):
         self.x = float(x)
         self.y = float(y)
@@ -26,6 +29,9 @@ class Vec2:
     def __eq__(self, other):
         return self.x == other.x and self.y == other.y
 
+    def __repr__(self):
+        return f"Vec2({self.x!r}, {self.y!r})"
+
     def tuple(self):
         return (self.x, self.y)
 
@@ -49,6 +55,62 @@ class Vec2:
         s = math.sin(theta_rad)
         return Vec2(self.x * c - self.y * s, self.x * s + self.y * c)
 
+
+class Vec2Array:
+    """
+    A set of points stored as one contiguous (N, 2) float array instead of N Vec2 objects.
+    Bulk operations stay in NumPy; indexing returns a Vec2.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = np.ascontiguousarray(data, dtype=np.float64).reshape(-1, 2)
+
+    @classmethod
+    def from_xy(cls, xs, ys):
+        data = np.empty((len(xs), 2), dtype=np.float64)
+        data[:, 0] = xs
+        data[:, 1] = ys
+        return cls(data)
+
+    @classmethod
+    def from_points(cls, pts):
+        # pts: Vec2 or (x, y) tuples
+        if len(pts) and isinstance(pts[0], Vec2):
+            return cls.from_xy([p.x for p in pts], [p.y for p in pts])
+        return cls(pts)
+
+    @property
+    def x(self):
+        return self.data[:, 0]
+
+    @property
+    def y(self):
+        return self.data[:, 1]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        x, y = self.data[i]
+        return Vec2(x, y)
+
+    def __iter__(self):
+        for x, y in self.data.tolist():
+            yield Vec2(x, y)
+
+    def relative_to(self, origin: Vec2):
+        return Vec2Array(self.data - (origin.x, origin.y))
+
+    def lengths(self):
+        return np.hypot(self.data[:, 0], self.data[:, 1])
+
+    def angles(self):
+        return np.arctan2(self.data[:, 1], self.data[:, 0])
+
+    def to_vec2_list(self):
+        return [Vec2(x, y) for x, y in self.data.tolist()]
+
 def rad_2_vec(rad: float):
     return Vec2(math.cos(rad), math.sin(rad))
 
@@ -0,0 +1,198 @@
+"""
+Precomputed visibility slices of a static room.
+
+Apart from their angle to the heading (theta_offset) and their order, the slices
+of a visibility polygon do not depend on the heading. A VisField therefore
+stores, for the center of every cell of a regular grid over the room, the
+heading-independent summary of every slice (area, avg_height, bisector) of the
+physical polygon (border and obstacles) and of the virtual one (border only).
+lookup() returns the slices of the cell containing a position, with
+theta_offset computed for the current heading: the exact slices of a point at
+most spacing / sqrt(2) away.
+
+A field is a directory named after a hash of the room and the grid spacing:
+
+    meta.json               grid, room and build parameters
+    <layer>_offsets.npy     int64 (cells + 1,), the slices of cell i are rows offsets[i]:offsets[i + 1]
+    <layer>_slices.npy      float64 (slices, 4): area, avg_height, bisector_x, bisector_y
+
+for the layers "physical" and "virtual". The arrays are memory-mapped, so a
+field opens instantly and only the pages that are looked up are read.
+Fields are built offline, in parallel, with tools/build_vis_field.py.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from tqdm import tqdm
+from .vec2 import Vec2
+from .environment import CompiledEnv
+from .vis_poly_rdw import VisPolyRdw
+from .visibility_polygon import SLICE_THETA_THRESHOLD, SliceArray
+
+FIELD_DIR = "vis_fields"
+FORMAT_VERSION = 2
+LAYERS = ("physical", "virtual")
+# grid spacing, same unit as the room (m for a Space)
+SPACING = 0.1
+# rows of cells per task of the builder
+CHUNK_ROWS = 4
+
+
+def field_key(border, obstacles, spacing=SPACING):
+    # the room, the grid and everything else that changes the stored slices
+    room = {
+        "border": [[float(x), float(y)] for x, y in border],
+        "obstacles": [[[float(x), float(y)] for x, y in obs] for obs in obstacles],
+        "spacing": float(spacing),
+        "threshold": SLICE_THETA_THRESHOLD,
+        "version": FORMAT_VERSION,
+    }
+    return hashlib.sha1(json.dumps(room, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def grid_for(border, spacing=SPACING):
+    xs = [p[0] for p in border]
+    ys = [p[1] for p in border]
+    nx = max(1, int(math.ceil((max(xs) - min(xs)) / spacing)))
+    ny = max(1, int(math.ceil((max(ys) - min(ys)) / spacing)))
+    return {"x0": min(xs), "y0": min(ys), "spacing": spacing, "nx": nx, "ny": ny}
+
+
+def cell_centers(grid):
+    s = grid["spacing"]
+    xs = grid["x0"] + (np.arange(grid["nx"]) + 0.5) * s
+    ys = grid["y0"] + (np.arange(grid["ny"]) + 0.5) * s
+    return xs, ys
+
+
+class VisField:
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.directory = directory
+        grid = self.meta["grid"]
+        self.x0 = grid["x0"]
+        self.y0 = grid["y0"]
+        self.spacing = grid["spacing"]
+        self.nx = grid["nx"]
+        self.ny = grid["ny"]
+        self.offsets = {layer: np.load(os.path.join(directory, layer + "_offsets.npy"), mmap_mode="r") for layer in LAYERS}
+        self.slices = {layer: np.load(os.path.join(directory, layer + "_slices.npy"), mmap_mode="r") for layer in LAYERS}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def find(cls, border, obstacles, spacing=SPACING, directory=FIELD_DIR):
+        """
+        The field built for this room and spacing under directory, or None.
+        """
+        path = os.path.join(directory, field_key(border, obstacles, spacing))
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return cls(path)
+
+    def cell(self, x, y):
+        # index of the cell containing (x, y), -1 outside the grid
+        i = int(math.floor((x - self.x0) / self.spacing))
+        j = int(math.floor((y - self.y0) / self.spacing))
+        if i < 0 or j < 0 or i >= self.nx or j >= self.ny:
+            return -1
+        return j * self.nx + i
+
+    def lookup(self, x, y, heading):
+        """
+        (physical, virtual) SliceArray summaries at (x, y) for the given heading, or None when the cell
+        is outside the room, in an obstacle, or has no slices (the caller computes them instead).
+        """
+        c = self.cell(x, y)
+        if c < 0:
+            self.misses += 1
+            return None
+        result = []
+        for layer in LAYERS:
+            lo, hi = self.offsets[layer][c:c + 2]
+            if lo == hi:
+                self.misses += 1
+                return None
+            rows = self.slices[layer][lo:hi]
+            result.append(SliceArray.from_summary(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3], heading))
+        self.hits += 1
+        return tuple(result)
+
+
+def _slice_rows(poly):
+    slices = poly.slice_array
+    return np.column_stack([slices.area, slices.avg_height, slices.bisector_x, slices.bisector_y])
+
+
+def _build_rows(border, obstacles, grid, rows, free, algorithm):
+    # slices of every free cell in rows: {layer: (count per cell, (n, 4) array)}
+    envs = {"physical": CompiledEnv(border, obstacles), "virtual": CompiledEnv(border)}
+    vis = VisPolyRdw(algorithm=algorithm)
+    xs, ys = cell_centers(grid)
+    result = {}
+    for layer in LAYERS:
+        counts = []
+        data = [np.empty((0, 4))]
+        for r, row_free in zip(rows, free):
+            for c in range(grid["nx"]):
+                if not row_free[c]:
+                    counts.append(0)
+                    continue
+                poly_rows = _slice_rows(vis.get_vis_poly(Vec2(xs[c], ys[r]), envs[layer], 0.0))
+                counts.append(len(poly_rows))
+                data.append(poly_rows)
+        result[layer] = (counts, np.concatenate(data))
+    return result
+
+
+def build_field(space, spacing=SPACING, directory=FIELD_DIR, workers=None, algorithm='numpy'):
+    """
+    Sample the slices of space (a utils.space.Space, or anything with border, obstacle_list and
+    in_obstacle_many) on a grid of the given spacing, in a process pool, and save the field
+    under directory. Return the opened VisField.
+    """
+    border = [tuple(p) for p in space.border]
+    obstacles = [[tuple(p) for p in obs] for obs in space.obstacle_list]
+    key = field_key(border, obstacles, spacing)
+    grid = grid_for(border, spacing)
+    xs, ys = cell_centers(grid)
+    gx, gy = np.meshgrid(xs, ys)
+    free = ~space.in_obstacle_many(gx, gy)
+
+    chunks = [list(range(r, min(r + CHUNK_ROWS, grid["ny"]))) for r in range(0, grid["ny"], CHUNK_ROWS)]
+    parts = [None] * len(chunks)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(_build_rows, border, obstacles, grid, rows, free[rows], algorithm): i
+                   for i, rows in enumerate(chunks)}
+        for future in tqdm(futures, total=len(futures), desc="field rows"):
+            parts[futures[future]] = future.result()
+
+    # write next to the final directory and rename, so a field is never seen half written
+    path = os.path.join(directory, key)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for layer in LAYERS:
+        counts = np.concatenate([np.asarray(part[layer][0], dtype=np.int64) for part in parts])
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        np.save(os.path.join(tmp, layer + "_offsets.npy"), offsets)
+        np.save(os.path.join(tmp, layer + "_slices.npy"), np.concatenate([part[layer][1] for part in parts]))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({
+            "key": key,
+            "grid": grid,
+            "border": border,
+            "obstacles": obstacles,
+            "algorithm": algorithm,
+            "free_cells": int(free.sum()),
+            "version": FORMAT_VERSION,
+        }, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return VisField(path)
@@ -5,11 +5,117 @@ This is a compact, self-contained translation of the core logic in the
 provided C++ sources. It implements a simple visibility-polygon routine (ray
 casting to all obstacle/vertex angles) and the RDW decision logic that
 computes steer targets and sets gains.
+The visibility routine can also run as an O(n log n) angular sweep, see
+angular_sweep.py, or as a vectorized NumPy ray caster, see numpy_backend.py.
+With incremental=True, VisPolyRdw keeps the polygon of the previous frame per
+environment: it is returned again while the viewer stays within
+reuse_distance of where it was computed, only re-sliced when the heading
+changed. Any larger move casts every ray again; only the sort of the ray
+angles starts from the previous vertex order. This pays off when users turn
+on the spot or stand still, not while they walk.
+get_vis_polys computes the physical and the virtual polygon of one pose together,
+sharing the rays and the border intersections between them.
 """
 import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from .vec2 import Vec2, rad_2_vec
 from .visibility_polygon import VisibilityPolygon
-from .geometry import ray_line_intersect, normalize
+from .geometry import ray_line_intersect_xy
+from .angular_sweep import sweep_rays
+from .numpy_backend import segment_array, hit_points, nearest_hits, nearest_hits_split, points_from_hits
+from .environment import CompiledEnv, env_segments, shares_border, crossing
+
+
+ALGORITHMS = ('raycast', 'sweep', 'numpy')
+# incremental mode: default reuse radius (same unit as the positions, m for a Space) and
+# number of environments whose previous polygon is kept
+REUSE_DISTANCE = 0.005
+CACHE_ENVS = 8
+# worker threads of the fused pass, one pool per thread count shared by every VisPolyRdw, so that
+# spaces built for each session (CompiledSpace) do not leave threads behind
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _thread_pool(threads):
+    with _pools_lock:
+        pool = _pools.get(threads)
+        if pool is None:
+            pool = _pools[threads] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="vis")
+        return pool
+
+
+def ray_angles(pos: Vec2, segments):
+    # collect unique angles towards every vertex, plus a ray just on each side
+    angles = []
+    eps = 1e-6
+    for s in segments:
+        for p in s:
+            dx = p.x - pos.x
+            dy = p.y - pos.y
+            ang = math.atan2(dy, dx)
+            angles.extend([ang - eps, ang, ang + eps])
+    return sorted(set(angles))
+
+
+def ordered_ray_angles(pos: Vec2, points, order=None):
+    """
+    Same rays as ray_angles, for the vertices in points. order is the vertex order by angle
+    of a previous call: from a nearby position it is almost sorted already, and timsort only
+    repairs the vertices that swapped places. Return (angles, new order).
+    """
+    ox = pos.x
+    oy = pos.y
+    vert = [math.atan2(p.y - oy, p.x - ox) for p in points]
+    order = sorted(order if order is not None else range(len(points)), key=vert.__getitem__)
+    eps = 1e-6
+    angles = []
+    for i in order:
+        ang = vert[i]
+        angles.append(ang - eps)
+        angles.append(ang)
+        angles.append(ang + eps)
+    # nearly sorted, only rays of vertices closer than eps can be out of place
+    angles.sort()
+    unique = angles[:1]
+    for ang in angles:
+        if ang != unique[-1]:
+            unique.append(ang)
+    return unique, order
+
+
+class _CachedPolygon:
+    __slots__ = ('env', 'points', 'order', 'pos', 'heading', 'poly')
+
+    def __init__(self, env, segments):
+        self.env = env
+        # every vertex starts exactly one segment
+        self.points = [seg[0] for seg in segments]
+        self.order = None
+        self.pos = None
+        self.heading = None
+        self.poly = None
+
+
+def cast_rays(pos: Vec2, segments, angles):
+    # brute force: every ray against every segment, O(V^2); the inner loop works on floats only
+    ox = pos.x
+    oy = pos.y
+    coords = [(p1.x, p1.y, p2.x, p2.y) for p1, p2 in segments]
+    intersections = []
+    for ang in angles:
+        dx = math.cos(ang)
+        dy = math.sin(ang)
+        best_t = float('inf')
+        for x1, y1, x2, y2 in coords:
+            t = ray_line_intersect_xy(ox, oy, dx, dy, x1, y1, x2, y2)
+            if t != -1.0 and t < best_t:
+                best_t = t
+        if best_t != float('inf'):
+            intersections.append((ang, Vec2(ox + dx * best_t, oy + dy * best_t)))
+    return intersections
 
 
 class RedirectionUnit:
@@ -25,8 +131,29 @@ class RedirectionUnit:
 
 
 class VisPolyRdw:
-    def __init__(self, phys_env=None, virt_env=None, resetter=None):
+    def __init__(self, phys_env=None, virt_env=None, resetter=None, algorithm='raycast',
+                 incremental=False, reuse_distance=REUSE_DISTANCE, reuse_angle=0.0, simplify_tolerance=0.0, threads=1):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"unknown visibility algorithm {algorithm!r}, expected one of {ALGORITHMS}")
         self.name = "Vis. Poly. RDW"
+        self.algorithm = algorithm
+        # temporal coherence between frames, see get_vis_poly
+        self.incremental = incremental
+        self.reuse_distance = reuse_distance
+        self.reuse_angle = reuse_angle
+        self._cache = {}
+        self.cache_hits = 0
+        self.cache_reslices = 0
+        self.cache_misses = 0
+        # boundaries are simplified (VisibilityPolygon.simplify) before slicing when > 0
+        self.simplify_tolerance = simplify_tolerance
+        self.polygons = 0
+        self.raw_vertices = 0
+        self.vertices = 0
+        # threads of the fused physical / virtual pass (get_vis_polys), from the shared _thread_pool
+        self.threads = threads
+        # per-stage timing of update (a utils.profiling.StageTimers), None to skip it
+        self.timers = None
         self.cur_rota_gain = 1.0
         self.min_rota_gain = 0.67
         self.max_rota_gain = 1.24
@@ -52,72 +179,174 @@ class VisPolyRdw:
 
     def get_vis_poly(self, pos: Vec2, env: dict, heading: float):
         # env expected to be a dict with 'vertices' (list of Vec2) and
-        # 'obstacles' (list of list of Vec2). Implements a simple angular
-        # sweep visibility algorithm.
-        segments = []
-        verts = env.get('vertices', [])
-        for i in range(len(verts)):
-            p1 = verts[i]
-            p2 = verts[(i + 1) % len(verts)]
-            segments.append((p1, p2))
-        for obs in env.get('obstacles', []):
-            for i in range(len(obs)):
-                p1 = obs[i]
-                p2 = obs[(i + 1) % len(obs)]
-                segments.append((p1, p2))
-
-        # collect unique angles towards every vertex
-        angles = []
-        eps = 1e-6
-        for s in segments:
-            for p in s:
-                dx = p.x - pos.x
-                dy = p.y - pos.y
-                ang = math.atan2(dy, dx)
-                angles.extend([ang - eps, ang, ang + eps])
-
-        intersections = []
-        for ang in sorted(set(angles)):
-            dir = rad_2_vec(ang)
-            best_t = float('inf')
-            best_pt = None
-            for seg in segments:
-                t = ray_line_intersect(pos, dir, seg[0], seg[1])
-                if t != -1.0 and t < best_t:
-                    best_t = t
-                    best_pt = Vec2(pos.x + dir.x * t, pos.y + dir.y * t)
-            if best_pt is not None:
-                intersections.append((ang, best_pt))
-
-        # sort by angle and return visibility polygon in absolute coords
-        intersections.sort(key=lambda x: x[0])
-        pts = [p for a, p in intersections]
-        return VisibilityPolygon(pts, pos, heading)
+        # 'obstacles' (list of list of Vec2), or a CompiledEnv. The rays are cast towards every
+        # vertex, either one by one against every segment ('raycast'), with
+        # an event-based angular sweep ('sweep') or all at once with NumPy
+        # broadcasting ('numpy').
+        if not self.incremental:
+            segments = env_segments(env)
+            return self.cast_vis_poly(pos, env, segments, ray_angles(pos, segments), heading)
+
+        # Incremental mode. The cache is keyed by the env object, so it must not be modified
+        # in place; the previous polygon is reused while pos stays within reuse_distance of the
+        # position it was computed at (only the slices are redone when the heading changed).
+        poly = self._cached_poly(pos, env, heading)
+        if poly is not None:
+            return poly
+        self.cache_misses += 1
+        entry, segments, angles = self._ordered_angles(pos, env)
+        return self._store(entry, pos, heading, self.cast_vis_poly(pos, env, segments, angles, heading))
+
+    def get_vis_polys(self, pos: Vec2, physical, virtual, heading: float):
+        """
+        (physical, virtual) visibility polygons of the same pose, where virtual is the border of physical
+        alone (CompiledEnv of the border, as in CompiledSpace). With the NumPy backend both come from one
+        fused pass: the rays of the physical polygon include those of the virtual one, so the border is
+        intersected once and the virtual polygon reads its hits from there. Same result as two get_vis_poly
+        calls; other environments and algorithms fall back to them.
+        """
+        if self.algorithm != 'numpy' or not shares_border(physical, virtual):
+            return self.get_vis_poly(pos, physical, heading), self.get_vis_poly(pos, virtual, heading)
+        if not self.incremental:
+            phys_angles = ray_angles(pos, physical.segments)
+            virt_angles = ray_angles(pos, virtual.segments)
+            return self.cast_vis_polys(pos, physical, virtual, phys_angles, virt_angles, heading)
+
+        phys = self._cached_poly(pos, physical, heading)
+        virt = self._cached_poly(pos, virtual, heading)
+        if phys is not None or virt is not None:
+            # at most one of them has to be computed
+            if phys is None:
+                phys = self.get_vis_poly(pos, physical, heading)
+            if virt is None:
+                virt = self.get_vis_poly(pos, virtual, heading)
+            return phys, virt
+        self.cache_misses += 2
+        phys_entry, _, phys_angles = self._ordered_angles(pos, physical)
+        virt_entry, _, virt_angles = self._ordered_angles(pos, virtual)
+        phys, virt = self.cast_vis_polys(pos, physical, virtual, phys_angles, virt_angles, heading)
+        return self._store(phys_entry, pos, heading, phys), self._store(virt_entry, pos, heading, virt)
+
+    def _cached_poly(self, pos, env, heading):
+        # the previous polygon of env when pos is close enough to where it was computed, else None
+        entry = self._cache.get(id(env))
+        if entry is None or entry.env is not env or entry.poly is None \
+                or math.hypot(pos.x - entry.pos.x, pos.y - entry.pos.y) > self.reuse_distance:
+            return None
+        if abs(math.remainder(heading - entry.heading, 2 * math.pi)) <= self.reuse_angle:
+            self.cache_hits += 1
+            return entry.poly
+        self.cache_reslices += 1
+        entry.poly = entry.poly.with_heading(heading)
+        entry.heading = heading
+        return entry.poly
+
+    def _ordered_angles(self, pos, env):
+        # cache entry of env, its segments and the ray angles at pos, sorted from the previous vertex order
+        segments = env_segments(env)
+        entry = self._cache.get(id(env))
+        if entry is None or entry.env is not env:
+            if len(self._cache) >= CACHE_ENVS:
+                del self._cache[next(iter(self._cache))]
+            entry = self._cache[id(env)] = _CachedPolygon(env, segments)
+        angles, entry.order = ordered_ray_angles(pos, entry.points, entry.order)
+        return entry, segments, angles
+
+    def _store(self, entry, pos, heading, poly):
+        entry.poly = poly
+        entry.pos = Vec2(pos.x, pos.y)
+        entry.heading = heading
+        return poly
+
+    def cache_stats(self):
+        # frames answered from the previous polygon, re-sliced for a new heading, or recomputed
+        total = self.cache_hits + self.cache_reslices + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "reslices": self.cache_reslices,
+            "misses": self.cache_misses,
+            "hit_rate": (self.cache_hits + self.cache_reslices) / total if total else 0.0,
+        }
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def simplify_stats(self):
+        # vertices of the polygons built so far, before and after simplification
+        return {
+            "polygons": self.polygons,
+            "raw_vertices": self.raw_vertices,
+            "vertices": self.vertices,
+            "reduction": self.raw_vertices / self.vertices if self.vertices else 1.0,
+        }
+
+    def cast_vis_poly(self, pos: Vec2, env, segments, angles, heading: float):
+        # visibility polygon from the rays at the given sorted angles
+        if self.algorithm == 'numpy':
+            seg_arr = env.seg_array if isinstance(env, CompiledEnv) else segment_array(segments)
+            # the hit points stay in one array until the polygon makes them relative to pos
+            _, pts = hit_points(pos, seg_arr, angles)
+        else:
+            # the sweep orders edges that never cross; other rooms fall back to the ray caster
+            if self.algorithm == 'sweep' and not crossing(env, segments):
+                intersections = sweep_rays(pos, segments, angles)
+            else:
+                intersections = cast_rays(pos, segments, angles)
+            # intersections are sorted by angle; visibility polygon in absolute coords
+            pts = [p for a, p in intersections]
+        return self._polygon(pts, pos, heading)
+
+    def cast_vis_polys(self, pos: Vec2, physical, virtual, phys_angles, virt_angles, heading: float):
+        # fused NumPy pass of get_vis_polys: the physical rays are intersected once with all segments and
+        # reduced separately over the border and the obstacles, the virtual rays read the border hits.
+        # With threads > 1 the rays are split between worker threads (NumPy releases the GIL).
+        border = len(virtual.seg_array)
+        phys_angles = np.asarray(phys_angles, dtype=np.float64)
+        virt_angles = np.asarray(virt_angles, dtype=np.float64)
+        if self.threads > 1 and len(phys_angles) >= 2 * self.threads:
+            chunks = np.array_split(phys_angles, self.threads)
+            parts = list(_thread_pool(self.threads).map(lambda a: nearest_hits_split(pos.x, pos.y, a, physical.seg_array, border), chunks))
+            t_border = np.concatenate([part[0] for part in parts])
+            t_obstacles = np.concatenate([part[1] for part in parts])
+        else:
+            t_border, t_obstacles = nearest_hits_split(pos.x, pos.y, phys_angles, physical.seg_array, border)
+        # both angle lists are computed the same way per vertex, so the virtual ones are found exactly
+        index = np.minimum(np.searchsorted(phys_angles, virt_angles), max(0, len(phys_angles) - 1))
+        if len(phys_angles) and np.array_equal(phys_angles[index], virt_angles):
+            t_virt = t_border[index]
+        else:
+            t_virt = nearest_hits(pos.x, pos.y, virt_angles, virtual.seg_array)
+        _, phys_pts = points_from_hits(pos, phys_angles, np.minimum(t_border, t_obstacles))
+        _, virt_pts = points_from_hits(pos, virt_angles, t_virt)
+        return self._polygon(phys_pts, pos, heading), self._polygon(virt_pts, pos, heading)
+
+    def _polygon(self, pts, pos, heading):
+        poly = VisibilityPolygon(pts, pos, heading, tolerance=self.simplify_tolerance)
+        self.polygons += 1
+        self.raw_vertices += poly.raw_vertex_count
+        self.vertices += len(poly.vert_array)
+        return poly
 
     def update_visibility_polygons(self, egocentric_user):
         # egocentric_user expected to provide state.get_virt_pos(), state.get_phys_pos(),
         # virtual_env(), physical_env() returning env dicts
-        self.virt_vis_poly = self.get_vis_poly(egocentric_user.state.get_virt_pos(), egocentric_user.virtual_env(), egocentric_user.state.get_virt_heading())
-        self.phys_vis_poly = self.get_vis_poly(egocentric_user.state.get_phys_pos(), egocentric_user.physical_env(), egocentric_user.state.get_phys_heading())
+        state = egocentric_user.state
+        if state.get_virt_pos() == state.get_phys_pos() and state.get_virt_heading() == state.get_phys_heading():
+            # same pose in both environments: one fused pass when the virtual env is the physical border
+            self.phys_vis_poly, self.virt_vis_poly = self.get_vis_polys(state.get_phys_pos(), egocentric_user.physical_env(), egocentric_user.virtual_env(), state.get_phys_heading())
+            return
+        self.virt_vis_poly = self.get_vis_poly(state.get_virt_pos(), egocentric_user.virtual_env(), state.get_virt_heading())
+        self.phys_vis_poly = self.get_vis_poly(state.get_phys_pos(), egocentric_user.physical_env(), state.get_phys_heading())
 
     def set_steer_target(self, egocentric_user):
         if not self.virt_vis_poly or not self.phys_vis_poly:
             return
-        if not self.virt_vis_poly.slices or not self.phys_vis_poly.slices:
+        virt = self.virt_vis_poly.slice_array
+        phys = self.phys_vis_poly.slice_array
+        if len(virt) == 0 or len(phys) == 0:
             return
-        virt_slice = self.virt_vis_poly.slices[0]
-        best_diff = float('inf')
-        best = None
-        for s in self.phys_vis_poly.slices:
-            # limit to reasonable frontal slices
-            if abs(s.theta_offset) > math.pi * 0.5:
-                continue
-            diff = abs(virt_slice.area - s.area)
-            if diff < best_diff:
-                best_diff = diff
-                best = s
-        if best is None:
-            best = self.phys_vis_poly.slices[0]
+        # closest area among the reasonable frontal slices
+        best = phys.view(phys.best_match(virt.area[virt.front()]))
         self.best_slice = best
         self.steer_target = egocentric_user.state.get_phys_pos() + best.bisector
 
@@ -168,9 +397,40 @@ class VisPolyRdw:
         return redir
 
     def update(self, dx, dy, dtheta, sim_state, egocentric_user):
-        self.update_visibility_polygons(egocentric_user)
-        self.set_steer_target(egocentric_user)
-        self.update_loss(sim_state, egocentric_user)
-        ru = self.set_gains(dx, dy, dtheta, sim_state, egocentric_user)
+        timers = self.timers
+        if timers is None:
+            self.update_visibility_polygons(egocentric_user)
+            self.set_steer_target(egocentric_user)
+            self.update_loss(sim_state, egocentric_user)
+            ru = self.set_gains(dx, dy, dtheta, sim_state, egocentric_user)
+        else:
+            timers.call("update_visibility_polygons", self.update_visibility_polygons, egocentric_user)
+            timers.call("set_steer_target", self.set_steer_target, egocentric_user)
+            timers.call("update_loss", self.update_loss, sim_state, egocentric_user)
+            ru = timers.call("set_gains", self.set_gains, dx, dy, dtheta, sim_state, egocentric_user)
         self.prev_loss = self.cur_loss
         return ru
+
+
+class CompiledSpace:
+    """
+    Per-session state for visibility-polygon controllers, built once when the start message arrives:
+    the physical environment (border and obstacles), the virtual environment (the border alone)
+    and a VisPolyRdw instance reused for every frame.
+    Attributes that are not defined here are looked up on the wrapped Space, so a CompiledSpace
+    can be handed to controllers in place of the Space itself.
+    """
+    def __init__(self, space, algorithm='raycast', incremental=False, reuse_distance=REUSE_DISTANCE, simplify_tolerance=0.0,
+                 threads=1):
+        self.space = space
+        self.physical = CompiledEnv(space.border, space.obstacle_list)
+        self.virtual = CompiledEnv(space.border)
+        self.vis = VisPolyRdw(algorithm=algorithm, incremental=incremental, reuse_distance=reuse_distance,
+                              simplify_tolerance=simplify_tolerance, threads=threads)
+        # optional precomputed slices of the room (vis_field.VisField), set by the controller
+        self.field = None
+
+    def __getattr__(self, name):
+        if name == 'space':
+            raise AttributeError(name)
+        return getattr(self.space, name)
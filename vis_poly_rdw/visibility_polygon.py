@@ -1,60 +1,330 @@
 import math
-from .vec2 import Vec2, rad_2_vec, polar
-from .geometry import orient, signed_angle, angle, polygon_area, normalize
+import numpy as np
+from .vec2 import Vec2, Vec2Array
+from .geometry import signed_angle_xy, polygon_area
 
 SLICE_THETA_THRESHOLD = 0.0174533  # ~1 degree in radians? keep as in C++
+# distance (same unit as the room) within which simplify may move the boundary
+SIMPLIFY_TOLERANCE = 0.01
+
+def _unit(x, y):
+    # normalized (x, y) as floats, (0, 0) for the zero vector like Vec2.normalized
+    l = math.hypot(x, y)
+    if l == 0:
+        return 0.0, 0.0
+    return x / l, y / l
 
 class Slice:
+    __slots__ = ('pts', 'p1', 'p2', 'p1_theta', 'p2_theta', 'bisector', 'theta_offset', 'width', 'area', 'avg_height')
+
     def __init__(self, pts, heading):
-        # pts: list of Vec2, already relative to center
-        self.pts = [Vec2(p.x, p.y) for p in pts]
+        # pts: list of Vec2, already relative to center; the list is copied, the Vec2 points are shared and not modified
+        self.pts = list(pts)
         self.pts.append(Vec2(0.0, 0.0))
-        self.p1 = self.pts[0]
-        self.p2 = self.pts[-2]
-        self.p1_theta = signed_angle(rad_2_vec(heading), normalize(self.p1))
-        self.p2_theta = signed_angle(rad_2_vec(heading), normalize(self.p2))
-        p1_to_p2 = self.p2 - self.p1
-        self.bisector = normalize(self.p1 + (p1_to_p2 * 0.5))
-        self.theta_offset = angle(rad_2_vec(heading), self.bisector)
-        self.width = abs(angle(normalize(self.p1), normalize(self.p2)))
+        p1 = self.p1 = self.pts[0]
+        p2 = self.p2 = self.pts[-2]
+        # everything below works on floats, the bisector is the only new Vec2
+        hx = math.cos(heading)
+        hy = math.sin(heading)
+        n1x, n1y = _unit(p1.x, p1.y)
+        n2x, n2y = _unit(p2.x, p2.y)
+        self.p1_theta = signed_angle_xy(hx, hy, n1x, n1y)
+        self.p2_theta = signed_angle_xy(hx, hy, n2x, n2y)
+        bx, by = _unit(p1.x + (p2.x - p1.x) * 0.5, p1.y + (p2.y - p1.y) * 0.5)
+        self.bisector = Vec2(bx, by)
+        self.theta_offset = abs(signed_angle_xy(hx, hy, bx, by))
+        self.width = abs(signed_angle_xy(n1x, n1y, n2x, n2y))
         self.area = polygon_area(self.pts)
         self.avg_height = 0.0
         for v in self.pts[:-1]:
-            self.avg_height += v.length()
+            self.avg_height += math.hypot(v.x, v.y)
         if len(self.pts) > 1:
             self.avg_height = self.avg_height / (len(self.pts) - 1)
         else:
             self.avg_height = 0.0
 
+def _column(name):
+    # read-only float attribute backed by one array of the SliceArray
+    return property(lambda self: float(getattr(self.array, name)[self.index]))
+
+class SliceView:
+    """
+    One slice of a SliceArray with the attributes of Slice, read from the arrays on access.
+    """
+    __slots__ = ('array', 'index')
+
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+    area = _column('area')
+    avg_height = _column('avg_height')
+    width = _column('width')
+    theta_offset = _column('theta_offset')
+    p1_theta = _column('p1_theta')
+    p2_theta = _column('p2_theta')
+
+    @property
+    def bisector(self):
+        return Vec2(self.array.bisector_x[self.index], self.array.bisector_y[self.index])
+
+    @property
+    def p1(self):
+        return Vec2(self.array.p1_x[self.index], self.array.p1_y[self.index])
+
+    @property
+    def p2(self):
+        return Vec2(self.array.p2_x[self.index], self.array.p2_y[self.index])
+
+    @property
+    def pts(self):
+        return [self.p1, self.p2, Vec2(0.0, 0.0)]
+
+class SliceArray:
+    """
+    The slices of a visibility polygon as a structure of arrays, in vertex order: one entry per
+    polygon edge that is neither colinear with the center nor narrower than SLICE_THETA_THRESHOLD.
+    Columns: p1_x, p1_y, p2_x, p2_y (relative to the center), p1_theta, p2_theta, bisector_x,
+    bisector_y, theta_offset, width, area, avg_height. order lists the slices by theta_offset
+    (stable, so ties keep vertex order), which is the order of VisibilityPolygon.slices.
+    Summaries without endpoints (see vis_field.py) leave p1_* / p2_* / p*_theta / width as None.
+    """
+    COLUMNS = ('p1_x', 'p1_y', 'p2_x', 'p2_y', 'p1_theta', 'p2_theta', 'bisector_x', 'bisector_y',
+               'theta_offset', 'width', 'area', 'avg_height')
+    __slots__ = COLUMNS + ('heading', 'order')
+
+    def __init__(self, **columns):
+        for name in self.COLUMNS:
+            setattr(self, name, columns.get(name))
+        self.heading = 0.0
+        self.order = None
+
+    @classmethod
+    def from_vertices(cls, xs, ys, heading):
+        """
+        Slices of the polygon with vertices (xs, ys) relative to the center, in a handful of array operations.
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        # next vertex of every vertex
+        xn = np.concatenate((xs[1:], xs[:1]))
+        yn = np.concatenate((ys[1:], ys[:1]))
+        # same expressions as the per-slice code: orient(p1, p2, origin) and the angle between the unit vectors
+        orient = (xn - xs) * (0.0 - yn) - (yn - ys) * (0.0 - xn)
+        ux, uy = _units(xs, ys)
+        uxn = np.concatenate((ux[1:], ux[:1]))
+        uyn = np.concatenate((uy[1:], uy[:1]))
+        spread = np.arctan2(ux * uyn - uy * uxn, ux * uxn + uy * uyn)
+        keep = np.flatnonzero((orient != 0) & (spread > SLICE_THETA_THRESHOLD))
+        p1_x = xs[keep]
+        p1_y = ys[keep]
+        p2_x = xn[keep]
+        p2_y = yn[keep]
+        bx, by = _units(p1_x + (p2_x - p1_x) * 0.5, p1_y + (p2_y - p1_y) * 0.5)
+        slices = cls(
+            p1_x=p1_x, p1_y=p1_y, p2_x=p2_x, p2_y=p2_y,
+            bisector_x=bx, bisector_y=by,
+            width=np.abs(spread[keep]),
+            area=np.abs(p1_x * p2_y - p2_x * p1_y) * 0.5,
+            avg_height=(np.hypot(p1_x, p1_y) + np.hypot(p2_x, p2_y)) / 2,
+        )
+        slices.set_heading(heading)
+        return slices
+
+    @classmethod
+    def from_summary(cls, area, avg_height, bisector_x, bisector_y, heading):
+        slices = cls(area=area, avg_height=avg_height, bisector_x=bisector_x, bisector_y=bisector_y)
+        slices.set_heading(heading)
+        return slices
+
+    def set_heading(self, heading):
+        # the only heading-dependent columns, and the order
+        hx = math.cos(heading)
+        hy = math.sin(heading)
+        self.heading = heading
+        self.theta_offset = np.abs(_signed_angles(hx, hy, self.bisector_x, self.bisector_y))
+        if self.p1_x is not None:
+            # the angle does not depend on the length, no need to normalize the endpoints
+            self.p1_theta = _signed_angles(hx, hy, self.p1_x, self.p1_y)
+            self.p2_theta = _signed_angles(hx, hy, self.p2_x, self.p2_y)
+        self.order = np.argsort(self.theta_offset, kind='stable')
+
+    def with_heading(self, heading):
+        # a copy for another heading, sharing the heading-independent arrays
+        slices = SliceArray(**{name: getattr(self, name) for name in self.COLUMNS})
+        slices.set_heading(heading)
+        return slices
+
+    def __len__(self):
+        return len(self.area)
+
+    def front(self):
+        # index of the slice closest to the heading (slices[0] of the polygon)
+        return int(self.order[0])
+
+    def best_match(self, area, max_offset=math.pi * 0.5):
+        """
+        Index of the slice whose area is closest to area among the slices within max_offset of the
+        heading; the first one in theta_offset order on ties, and front() when none is that close.
+        """
+        diff = np.abs(area - self.area)
+        diff[self.theta_offset > max_offset] = np.inf
+        best = diff.min()
+        if best == np.inf:
+            return self.front()
+        candidates = np.flatnonzero(diff == best)
+        if len(candidates) == 1:
+            return int(candidates[0])
+        rank = np.empty(len(self.order), dtype=np.intp)
+        rank[self.order] = np.arange(len(self.order))
+        return int(candidates[np.argmin(rank[candidates])])
+
+    def view(self, index):
+        return SliceView(self, index)
+
+def _units(xs, ys):
+    # array version of _unit; zero vectors are divided by inf and stay (0, 0)
+    l = np.hypot(xs, ys)
+    l[l == 0] = np.inf
+    return xs / l, ys / l
+
+def _signed_angles(hx, hy, xs, ys):
+    return np.arctan2(hx * ys - hy * xs, hx * xs + hy * ys)
+
+def _segment_distances(px, py, ax, ay, bx, by):
+    # distance from every point p to the segment a-b
+    dx = bx - ax
+    dy = by - ay
+    l2 = dx * dx + dy * dy
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / np.where(l2 > 0, l2, 1.0), 0.0, 1.0)
+    return np.hypot(ax + t * dx - px, ay + t * dy - py)
+
+def simplify_ring(xs, ys, tolerance):
+    """
+    Indices of the vertices of the closed ring (xs, ys) to keep so that every dropped vertex lies within
+    tolerance of the edge that replaces it. Vertices that stray more than tolerance from the chord of their
+    two neighbours are kept first; then, like Douglas-Peucker but for all runs at once, every run of dropped
+    vertices that strays too far from its chord keeps its farthest vertex, until none does. Every step is
+    a few array operations over the whole ring.
+    """
+    n = len(xs)
+    everything = np.arange(n)
+    if n <= 3 or tolerance <= 0:
+        return everything
+    # the rays cast on both sides of every vertex land close together: collapse those points first,
+    # so that corners are judged against their real neighbours
+    seed = np.flatnonzero(np.hypot(xs - np.roll(xs, 1), ys - np.roll(ys, 1)) > tolerance)
+    if len(seed) < 3:
+        return everything
+    sx = xs[seed]
+    sy = ys[seed]
+    deviation = _segment_distances(sx, sy, np.roll(sx, 1), np.roll(sy, 1), np.roll(sx, -1), np.roll(sy, -1))
+    keep = np.zeros(n, dtype=bool)
+    keep[seed[deviation > tolerance]] = True
+    if keep.sum() < 3:
+        return everything
+    while True:
+        kept = np.flatnonzero(keep)
+        dropped = np.flatnonzero(~keep)
+        if len(dropped) == 0:
+            return kept
+        # the kept vertices before and after every dropped one, around the ring
+        a = kept[np.searchsorted(kept, dropped) - 1]
+        b = kept[np.searchsorted(kept, dropped) % len(kept)]
+        d = _segment_distances(xs[dropped], ys[dropped], xs[a], ys[a], xs[b], ys[b])
+        # farthest distance of every run; dropped is sorted, so runs are contiguous except the one
+        # wrapping around the end of the ring, which appears as the first and the last group
+        starts = np.flatnonzero(np.concatenate(([True], a[1:] != a[:-1])))
+        worst = np.maximum.reduceat(d, starts)
+        if len(starts) > 1 and a[0] == a[-1]:
+            worst[0] = worst[-1] = max(worst[0], worst[-1])
+        worst = np.repeat(worst, np.diff(np.append(starts, len(d))))
+        split = (d > tolerance) & (d == worst)
+        if not split.any():
+            return kept
+        keep[dropped[split]] = True
+
 class VisibilityPolygon:
-    def __init__(self, boundary_pts=None, center=None, heading=0.0, env=None):
-        # boundary_pts: list of Vec2 (absolute coords) OR None when using env
-        self.verts = []
-        self.slices = []
+    """
+    The vertices are kept relative to the center as a Vec2Array (vert_array) and the slices as a
+    SliceArray (slice_array). verts, slices (sorted by theta_offset) and vertex_slices are lists
+    of Vec2 / SliceView built from them on first access.
+    """
+    def __init__(self, boundary_pts=None, center=None, heading=0.0, env=None, tolerance=0.0):
+        # boundary_pts: list of Vec2 or a Vec2Array (absolute coords) OR None when using env;
+        # with tolerance > 0 the boundary is simplified (see simplify) before the slices are computed
+        self.vert_array = Vec2Array(np.empty((0, 2)))
+        self.slice_array = SliceArray.from_vertices([], [], heading)
+        self._verts = None
+        self._slices = None
+        self._vertex_slices = None
         self.center = None
         self.env = env
         self.heading = heading
+        # vertex count before simplification
+        self.raw_vertex_count = 0
         if boundary_pts is not None and center is not None:
             self.center = Vec2(center.x, center.y)
-            for v in boundary_pts:
-                self.verts.append(Vec2(v.x - center.x, v.y - center.y))
+            if isinstance(boundary_pts, Vec2Array):
+                self.vert_array = boundary_pts.relative_to(center)
+            else:
+                self.vert_array = Vec2Array.from_xy([v.x - center.x for v in boundary_pts], [v.y - center.y for v in boundary_pts])
+            self.raw_vertex_count = len(self.vert_array)
+            if tolerance > 0:
+                self._simplify_vertices(tolerance)
             self.compute_slices()
 
-    def simplify(self):
-        # Not implemented in detail; placeholder
-        pass
+    @property
+    def verts(self):
+        if self._verts is None:
+            self._verts = self.vert_array.to_vec2_list()
+        return self._verts
+
+    @verts.setter
+    def verts(self, verts):
+        self.vert_array = Vec2Array.from_points(verts) if len(verts) else Vec2Array(np.empty((0, 2)))
+        self._verts = list(verts)
+
+    @property
+    def slices(self):
+        if self._slices is None:
+            self._slices = [SliceView(self.slice_array, i) for i in self.slice_array.order.tolist()]
+        return self._slices
+
+    @property
+    def vertex_slices(self):
+        if self._vertex_slices is None:
+            self._vertex_slices = [SliceView(self.slice_array, i) for i in range(len(self.slice_array))]
+        return self._vertex_slices
+
+    def with_heading(self, heading):
+        # the same boundary seen with another heading: shares the vertices, the slices are only re-angled
+        poly = VisibilityPolygon(heading=heading, env=self.env)
+        poly.center = self.center
+        poly.vert_array = self.vert_array
+        poly._verts = self._verts
+        poly.raw_vertex_count = self.raw_vertex_count
+        poly.slice_array = self.slice_array.with_heading(heading)
+        return poly
+
+    def simplify(self, tolerance=SIMPLIFY_TOLERANCE):
+        """
+        Merge nearly colinear edges and drop sliver spikes: remove the vertices that lie within tolerance of
+        the edge replacing them (simplify_ring), then recompute the slices. Return the number of vertices removed.
+        """
+        removed = self._simplify_vertices(tolerance)
+        self.compute_slices()
+        return removed
+
+    def _simplify_vertices(self, tolerance):
+        keep = simplify_ring(self.vert_array.x, self.vert_array.y, tolerance)
+        removed = len(self.vert_array) - len(keep)
+        if removed:
+            self.vert_array = Vec2Array(self.vert_array.data[keep])
+            self._verts = None
+        return removed
 
     def compute_slices(self):
-        self.slices = []
-        n = len(self.verts)
-        for i in range(n):
-            p1 = self.verts[i]
-            p2 = self.verts[(i + 1) % n]
-            # skip colinear or too-narrow slices
-            if orient(p1, p2, Vec2(0, 0)) == 0:
-                continue
-            if signed_angle(normalize(p1), normalize(p2)) <= SLICE_THETA_THRESHOLD:
-                continue
-            s = Slice([p1, p2], self.heading)
-            self.slices.append(s)
-        self.slices.sort(key=lambda s: s.theta_offset)
+        self.slice_array = SliceArray.from_vertices(self.vert_array.x, self.vert_array.y, self.heading)
+        self._slices = None
+        self._vertex_slices = None